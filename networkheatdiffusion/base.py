@@ -1,16 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import json
 import logging
+import weakref
+from itertools import compress
+from itertools import islice
 import requests
-import networkx
 import numpy
-from scipy.sparse import csc_matrix
-from scipy.sparse.linalg import expm_multiply
+from scipy.linalg import expm
+from scipy.sparse import coo_matrix
+from scipy.sparse import identity
+from scipy.sparse.csgraph import connected_components
 from ndex2.nice_cx_network import NiceCXNetwork
-from ndex2.nice_cx_network import DefaultNetworkXFactory
 
 from networkheatdiffusion import constants
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -21,12 +30,158 @@ class HeatDiffusionError(Exception):
     pass
 
 
+class _CachedLaplacian(object):
+    """
+    Laplacian matrix along with values derived from it that are
+    needed to compute the action of its matrix exponential. These are
+    computed once and reused for every diffusion run with this object
+    """
+    __slots__ = ('matrix', 'normalized', 'num_nodes', 'trace', 'mu',
+                 '_norm', '_shifted_matrix', '_taylor_parameters',
+                 '_component_labels', '_seed_components')
+
+    def __init__(self, matrix, normalized=False):
+        """
+        Constructor
+
+        :param matrix: laplacian matrix
+        :type matrix: :py:class:`scipy.sparse.csr_matrix`
+        :param normalized: `True` if 'matrix' is a normalized laplacian
+        :type normalized: bool
+        """
+        self.matrix = matrix
+        self.normalized = normalized
+        self.num_nodes = matrix.shape[0]
+        self.trace = matrix.diagonal().sum()
+        self.mu = self.trace / self.num_nodes
+        self._norm = None
+        self._shifted_matrix = None
+        self._taylor_parameters = dict()
+        self._component_labels = None
+        self._seed_components = None
+
+    def get_norm(self):
+        """
+        Gets bound on norm of laplacian shifted by ``mu * I``, computing
+        it on first call
+
+        With non negative edge weights the laplacian is symmetric positive
+        semi definite with largest eigenvalue no more then ``2`` if
+        normalized or else ``2 * max degree``, so the norm of the shifted
+        matrix is at most ``max(bound - mu, mu)``. This is usually smaller
+        then the 1-norm, most of all for normalized laplacians, and avoids
+        the pass taking absolute column sums of the matrix. The exact
+        1-norm is used if an edge weight is negative
+
+        :return: norm of shifted laplacian
+        :rtype: float
+        """
+        if self._norm is not None:
+            return self._norm
+
+        diagonal = self.matrix.diagonal()
+        # any positive value off the diagonal means a negative edge weight
+        if numpy.count_nonzero(self.matrix.data > 0) == numpy.count_nonzero(diagonal > 0):
+            if self.normalized:
+                eigenvalue_bound = 2.0
+            else:
+                eigenvalue_bound = 2.0 * diagonal.max()
+            self._norm = float(max(eigenvalue_bound - self.mu, self.mu))
+        else:
+            column_sums = numpy.asarray(abs(self.matrix).sum(axis=0)).ravel()
+            self._norm = float((column_sums - abs(diagonal) +
+                                abs(diagonal - self.mu)).max())
+        return self._norm
+
+    def get_shifted_matrix(self):
+        """
+        Gets ``mu * I - matrix``, computing it on first call, so each
+        step of the Taylor series is a single matrix vector product
+
+        :return: negated and shifted laplacian
+        :rtype: :py:class:`scipy.sparse.csr_matrix`
+        """
+        if self._shifted_matrix is None:
+            shifted = (self.mu * identity(self.num_nodes,
+                                          dtype=self.matrix.dtype,
+                                          format='csr') - self.matrix)
+            self._shifted_matrix = shifted.astype(self.matrix.dtype,
+                                                  copy=False).tocsr()
+        return self._shifted_matrix
+
+    def get_taylor_parameters(self, time):
+        """
+        Gets Taylor degree `m` and number of scaling steps `s`
+        that minimize the number of matrix vector products
+        ``m * s`` needed to diffuse for `time` (Al-Mohy and Higham 2011,
+        code fragment 3.1)
+
+        :param time: diffusion time
+        :type time: float
+        :return: (m, s)
+        :rtype: tuple
+        """
+        if time not in self._taylor_parameters:
+            norm = time * self.get_norm()
+            best_m = 0
+            best_s = 1
+            if norm > 0.0:
+                best_m = None
+                for m, theta in constants.TAYLOR_THETA.items():
+                    s = int(numpy.ceil(norm / theta))
+                    if best_m is None or m * s < best_m * best_s:
+                        best_m = m
+                        best_s = s
+            self._taylor_parameters[time] = (best_m, best_s)
+        return self._taylor_parameters[time]
+
+    def get_seed_components(self, seeds):
+        """
+        Gets nodes in connected components that contain a node in
+        'seeds' along with the laplacian restricted to those nodes.
+        Heat never leaves a connected component so diffusing on this
+        smaller laplacian gives the same result for these nodes while
+        every other node stays at zero heat.
+
+        Only the result for the most recent 'seeds' components is kept,
+        so repeated diffusions from the same seeds reuse it while memory
+        use stays bounded
+
+        :param seeds: indices of nodes with non zero heat
+        :type seeds: :py:class:`numpy.ndarray`
+        :return: (indices of nodes sorted ascending,
+                  :py:class:`_CachedLaplacian` for those nodes) or `None`
+                  if the components containing 'seeds' span every node
+        :rtype: tuple
+        """
+        if self._component_labels is None:
+            num_components, self._component_labels =\
+                connected_components(self.matrix, directed=False)
+        seed_labels = numpy.unique(self._component_labels[seeds])
+        key = seed_labels.tobytes()
+        if self._seed_components is not None and\
+                self._seed_components[0] == key:
+            return self._seed_components[1]
+
+        indices = numpy.flatnonzero(numpy.isin(self._component_labels,
+                                               seed_labels))
+        if len(indices) == self.num_nodes:
+            components = None
+        else:
+            matrix = self.matrix[indices][:, indices]
+            components = (indices, _CachedLaplacian(matrix,
+                                                    normalized=self.normalized))
+        self._seed_components = (key, components)
+        return components
+
+
 class HeatDiffusion(object):
     """
     Runs heat diffusion on remote service
     """
     def __init__(self, service_endpoint=constants.DEFAULT_SERVICE_ENDPOINT,
-                 connect_timeout=360):
+                 connect_timeout=360,
+                 dtype=constants.DEFAULT_DATA_TYPE):
         """
         Constructor
 
@@ -34,67 +189,469 @@ class HeatDiffusion(object):
         :type service_endpoint: str
         :param connect_timeout: timeout in seconds to wait for connection to service
         :type connect_timeout: int
+        :param dtype: floating point type used by local diffusion,
+                      either :py:class:`numpy.float64` or
+                      :py:class:`numpy.float32`. :py:class:`numpy.float32`
+                      halves memory use and traffic at the cost of
+                      precision, which can reorder nodes with nearly
+                      equal heat
+        :type dtype: :py:class:`numpy.dtype`
+        :raises HeatDiffusionError: If 'dtype' is not
+                                    :py:class:`numpy.float32` or
+                                    :py:class:`numpy.float64`
         """
+        try:
+            supported = numpy.dtype(dtype) in (numpy.dtype(numpy.float32),
+                                               numpy.dtype(numpy.float64))
+        except TypeError:
+            supported = False
+        if dtype is None or not supported:
+            raise HeatDiffusionError('dtype must be numpy.float32 or '
+                                     'numpy.float64: ' + str(dtype))
+        self._dtype = numpy.dtype(dtype)
         self._connect_timeout = connect_timeout
         self._service_endpoint = service_endpoint
+        # reused so repeated service calls keep the connection alive
+        self._session = requests.Session()
+        # laplacians of networks diffused locally with cache_laplacian
+        # set to True, dropped along with the network
+        self._laplacian_cache = weakref.WeakKeyDictionary()
         if self._service_endpoint is None:
             self._service_endpoint = constants.DEFAULT_SERVICE_ENDPOINT
         else:
             LOGGER.debug('Using custom service endpoint: ' +
                          self._service_endpoint)
 
-    def _create_sparse_matrix(self, network, normalize=False):
+    def __getstate__(self):
         """
+        Gets state for :py:mod:`pickle` leaving out cached laplacians
+        which can not be pickled as they are weakly keyed by network
 
-        :param network:
-        :param normalize:
-        :return:
+        :return: instance attributes
+        :rtype: dict
+        """
+        state = self.__dict__.copy()
+        del state['_laplacian_cache']
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores state from :py:mod:`pickle` with an empty laplacian cache
+
+        :param state: instance attributes
+        :type state: dict
+        """
+        self.__dict__.update(state)
+        self._laplacian_cache = weakref.WeakKeyDictionary()
+
+    def close(self):
+        """
+        Closes connections to diffusion service left open by
+        invocations of :py:meth:`run_diffusion` with `via_service`
+        set to `True`
+        """
+        self._session.close()
+
+    def invalidate_cache(self, cxnetwork=None):
         """
+        Drops laplacian matrices cached by :py:meth:`run_diffusion` and
+        :py:meth:`run_diffusion_batch` when invoked with
+        `cache_laplacian` set to `True`.
+
+        A cached laplacian is only rebuilt automatically if the number
+        of nodes, edges or edge attributes of a network changes, so this
+        method must be called after any other change to the nodes,
+        edges or edge weights of a cached network
+
+        :param cxnetwork: network whose laplacian should be dropped,
+                          if `None` all cached laplacians are dropped
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        """
+        if cxnetwork is None:
+            self._laplacian_cache.clear()
+            return
+        try:
+            self._laplacian_cache.pop(cxnetwork, None)
+        except TypeError:
+            pass
+
+    def _get_laplacian(self, cxnetwork, normalize=False,
+                       use_cache=False):
+        """
+        Gets laplacian of 'cxnetwork'. If 'use_cache' is `True` the one
+        built by a previous call for the same network is reused if the
+        network still has the same number of nodes, edges and edge
+        attributes. Along with the matrix this keeps the values derived
+        from it in :py:class:`_CachedLaplacian`
+
+        :param cxnetwork: network to get laplacian matrix for
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        :param normalize: If `True`, get normalized laplacian matrix
+        :type normalize: bool
+        :param use_cache: If `True`, reuse and cache laplacian of
+                          'cxnetwork'
+        :type use_cache: bool
+        :return: (:py:class:`dict` of node id to index in matrix,
+                  :py:class:`_CachedLaplacian`)
+        :rtype: tuple
+        """
+        if use_cache is not True:
+            node_index, matrix = self._laplacian_from_cx(cxnetwork,
+                                                         normalize=normalize)
+            return node_index, _CachedLaplacian(matrix, normalized=normalize)
+
+        fingerprint = (len(cxnetwork.nodes), len(cxnetwork.edges),
+                       len(cxnetwork.edgeAttributes))
+        try:
+            cached = self._laplacian_cache.setdefault(cxnetwork, dict())
+        except TypeError:
+            # network can not be weakly referenced so is not cached
+            cached = dict()
+        entry = cached.get(normalize)
+        if entry is not None and entry[0] == fingerprint:
+            LOGGER.debug('Using cached laplacian')
+            return entry[1], entry[2]
+
+        node_index, matrix = self._laplacian_from_cx(cxnetwork,
+                                                     normalize=normalize)
+        laplacian = _CachedLaplacian(matrix, normalized=normalize)
+        cached[normalize] = (fingerprint, node_index, laplacian)
+        return node_index, laplacian
+
+    def _laplacian_from_cx(self, cxnetwork, normalize=False):
+        """
+        Builds laplacian matrix directly from edges of 'cxnetwork'
+        without creating an intermediate :py:class:`networkx.MultiGraph`
+
+        Parallel edges are summed and the edge attribute ``weight``,
+        if set, is used as edge weight which matches
+        :py:func:`networkx.laplacian_matrix` on a
+        :py:class:`networkx.MultiGraph`
+
+        :param cxnetwork: network to build laplacian matrix from
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        :param normalize: If `True`, create normalized laplacian matrix
+        :type normalize: bool
+        :return: (:py:class:`dict` of node id to index in matrix,
+                  laplacian matrix)
+        :rtype: tuple
+        """
+        node_index = {node_id: i for i, node_id in enumerate(cxnetwork.nodes)}
+        num_edges = len(cxnetwork.edges)
+        sources = numpy.empty(num_edges, dtype=numpy.int64)
+        targets = numpy.empty(num_edges, dtype=numpy.int64)
+        weights = numpy.ones(num_edges, dtype=self._dtype)
+        edge_attributes = cxnetwork.edgeAttributes
+        for i, (edge_id, edge_obj) in enumerate(cxnetwork.get_edges()):
+            # edges to nodes not in nodes aspect get appended, same
+            # as networkx.Graph.add_edge()
+            sources[i] = node_index.setdefault(edge_obj['s'], len(node_index))
+            targets[i] = node_index.setdefault(edge_obj['t'], len(node_index))
+            e_attributes = edge_attributes.get(edge_id)
+            if e_attributes is None:
+                continue
+            for e_attr in e_attributes:
+                if e_attr['n'] == 'weight':
+                    weights[i] = float(e_attr['v'])
+
+        return node_index, self._laplacian_from_edges(sources, targets,
+                                                      weights,
+                                                      len(node_index),
+                                                      normalize=normalize,
+                                                      dtype=self._dtype)
+
+    @staticmethod
+    def _laplacian_from_edges(sources, targets, weights, num_nodes,
+                              normalize=False,
+                              dtype=constants.DEFAULT_DATA_TYPE):
+        """
+        Builds laplacian matrix from undirected edges given as
+        parallel arrays of node indices and weights. Self loops
+        count toward degree in the same manner as
+        :py:func:`networkx.normalized_laplacian_matrix`
+
+        :param sources: index of source node of each edge
+        :type sources: :py:class:`numpy.ndarray`
+        :param targets: index of target node of each edge
+        :type targets: :py:class:`numpy.ndarray`
+        :param weights: weight of each edge
+        :type weights: :py:class:`numpy.ndarray`
+        :param num_nodes: number of nodes
+        :type num_nodes: int
+        :param normalize: If `True`, create normalized laplacian matrix
+        :type normalize: bool
+        :param dtype: floating point type of laplacian matrix
+        :type dtype: :py:class:`numpy.dtype`
+        :return: laplacian matrix
+        :rtype: :py:class:`scipy.sparse.csr_matrix`
+        """
+        # triplets are written into arrays allocated once: every edge,
+        # the reverse of every edge that is not a self loop, then the
+        # diagonal
+        num_edges = len(sources)
+        not_loop = sources != targets
+        num_entries = num_edges + numpy.count_nonzero(not_loop)
+        size = num_entries + num_nodes
+        rows = numpy.empty(size, dtype=numpy.int64)
+        cols = numpy.empty(size, dtype=numpy.int64)
+        data = numpy.empty(size, dtype=dtype)
+        rows[:num_edges] = sources
+        cols[:num_edges] = targets
+        data[:num_edges] = weights
+        rows[num_edges:num_entries] = targets[not_loop]
+        cols[num_edges:num_entries] = sources[not_loop]
+        data[num_edges:num_entries] = weights[not_loop]
+        degree = numpy.bincount(rows[:num_entries],
+                                weights=data[:num_entries],
+                                minlength=num_nodes)
+        numpy.negative(data[:num_entries], out=data[:num_entries])
+        rows[num_entries:] = numpy.arange(num_nodes)
+        cols[num_entries:] = rows[num_entries:]
+        data[num_entries:] = degree
         if normalize:
-            return csc_matrix(networkx.normalized_laplacian_matrix(network),
-                              dtype=constants.DEFAULT_DATA_TYPE)
+            with numpy.errstate(divide='ignore'):
+                inv_sqrt_degree = 1.0 / numpy.sqrt(degree)
+            inv_sqrt_degree[numpy.isinf(inv_sqrt_degree)] = 0.0
+            data *= inv_sqrt_degree[rows] * inv_sqrt_degree[cols]
+
+        return coo_matrix((data, (rows, cols)),
+                          shape=(num_nodes, num_nodes),
+                          dtype=dtype).tocsr()
+
+    def _diffuse(self, laplacian, heat_array, time):
+        """
+        Computes ``expm(-time * matrix) * heat_array`` at the single
+        time point `time`
+
+        If fewer then
+        :py:const:`~networkheatdiffusion.constants.SPARSE_SEED_FRACTION`
+        of the nodes have heat, diffusion is only run on the connected
+        components containing those nodes.
+
+        For networks with more then
+        :py:const:`~networkheatdiffusion.constants.KRYLOV_NODE_THRESHOLD`
+        nodes a Krylov subspace approximation is tried first, falling back to
+        a truncated Taylor series if it does not converge
+
+        :param laplacian: laplacian matrix
+        :type laplacian: :py:class:`_CachedLaplacian`
+        :param heat_array: input heat ordered by node index, either
+                           one heat per node or a column of heats
+                           per diffusion
+        :type heat_array: :py:class:`numpy.ndarray`
+        :param time: diffusion time
+        :type time: float
+        :return: diffused heat ordered by node index
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if heat_array.ndim == 1:
+            seeds = numpy.flatnonzero(heat_array)
         else:
-            return csc_matrix(networkx.laplacian_matrix(network),
-                              dtype=constants.DEFAULT_DATA_TYPE)
+            seeds = numpy.flatnonzero(heat_array.any(axis=1))
+        if 0 < len(seeds) < constants.SPARSE_SEED_FRACTION * laplacian.num_nodes:
+            seed_components = laplacian.get_seed_components(seeds)
+            if seed_components is not None:
+                indices, sub_laplacian = seed_components
+                LOGGER.debug('Diffusing on ' + str(len(indices)) + ' of ' +
+                             str(laplacian.num_nodes) + ' nodes in '
+                             'connected components with heat')
+                diffused = numpy.zeros_like(heat_array)
+                diffused[indices] = self._expmv(sub_laplacian,
+                                                heat_array[indices], time)
+                return diffused
+        return self._expmv(laplacian, heat_array, time)
 
-    def _diffuse(self, matrix, heat_array, time):
+    def _expmv(self, laplacian, heat_array, time):
         """
+        Computes ``expm(-time * matrix) * heat_array`` with Krylov
+        subspace approximation for networks with more then
+        :py:const:`~networkheatdiffusion.constants.KRYLOV_NODE_THRESHOLD`
+        nodes, falling back to a truncated Taylor series
 
-        :param matrix:
-        :param heat_array:
-        :param time:
-        :return:
+        :param laplacian: laplacian matrix
+        :type laplacian: :py:class:`_CachedLaplacian`
+        :param heat_array: input heat ordered by node index
+        :type heat_array: :py:class:`numpy.ndarray`
+        :param time: diffusion time
+        :type time: float
+        :return: diffused heat ordered by node index
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        # single precision can not meet the double precision tolerances
+        eps = numpy.finfo(laplacian.matrix.dtype).eps
+        taylor_tolerance = max(constants.TAYLOR_TOLERANCE, eps / 2)
+        if laplacian.num_nodes <= constants.KRYLOV_NODE_THRESHOLD:
+            return self._taylor_expmv(laplacian, heat_array, time,
+                                      tolerance=taylor_tolerance)
+
+        krylov_tolerance = max(constants.KRYLOV_TOLERANCE, eps)
+        if heat_array.ndim == 1:
+            diffused = self._krylov_expmv(laplacian.matrix, heat_array, time,
+                                          tolerance=krylov_tolerance)
+            if diffused is not None:
+                return diffused
+            LOGGER.debug('Krylov approximation did not converge, '
+                         'falling back to Taylor series')
+            return self._taylor_expmv(laplacian, heat_array, time,
+                                      tolerance=taylor_tolerance)
+
+        # krylov subspace depends on heat so each column is done on
+        # its own, columns where it fails share one Taylor series run
+        diffused = numpy.empty_like(heat_array)
+        not_converged = []
+        for k in range(heat_array.shape[1]):
+            column = self._krylov_expmv(laplacian.matrix, heat_array[:, k],
+                                        time, tolerance=krylov_tolerance)
+            if column is None:
+                not_converged.append(k)
+            else:
+                diffused[:, k] = column
+        if not_converged:
+            LOGGER.debug('Krylov approximation did not converge for ' +
+                         str(len(not_converged)) + ' heat columns, '
+                         'falling back to Taylor series')
+            diffused[:, not_converged] = self._taylor_expmv(laplacian,
+                                                            heat_array[:, not_converged],
+                                                            time,
+                                                            tolerance=taylor_tolerance)
+        return diffused
+
+    @staticmethod
+    def _taylor_expmv(laplacian, heat_array, time,
+                      tolerance=constants.TAYLOR_TOLERANCE):
         """
-        return expm_multiply(-matrix, heat_array,
-                             start=0, stop=time,
-                             endpoint=True)[-1]
+        Computes ``expm(-time * matrix) * heat_array`` with the shifted,
+        scaled and truncated Taylor series of Al-Mohy and Higham (2011)
+        which is what :py:func:`scipy.sparse.linalg.expm_multiply` runs
+        internally. Trace, norm and series parameters come from
+        'laplacian' so they are not recomputed on repeated calls.
 
-    def _find_heat(self, network, heat_key):
+        If 'heat_array' has a column of heats per diffusion the
+        laplacian is applied to all columns at once and the series
+        is truncated once every column has converged
+
+        :param laplacian: laplacian matrix
+        :type laplacian: :py:class:`_CachedLaplacian`
+        :param heat_array: input heat ordered by node index
+        :type heat_array: :py:class:`numpy.ndarray`
+        :param time: diffusion time
+        :type time: float
+        :param tolerance: relative size of Taylor term below which
+                          series is truncated
+        :type tolerance: float
+        :return: diffused heat ordered by node index
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        m, s = laplacian.get_taylor_parameters(time)
+        if m == 0:
+            return heat_array.copy()
+        shifted = laplacian.get_shifted_matrix()
+        eta = numpy.exp(-time * laplacian.mu / s)
+        # updated in place to avoid allocating temporaries every step
+        diffused = numpy.array(heat_array, dtype=shifted.dtype)
+        term = diffused.copy()
+        # inf norm without the argument checks of numpy.linalg.norm
+        # which dominate the per step cost on small networks
+        absolute = numpy.absolute
+        for i in range(s):
+            c1 = absolute(term).max(axis=0)
+            for j in range(m):
+                term = shifted.dot(term)
+                term *= time / (s * (j + 1))
+                c2 = absolute(term).max(axis=0)
+                diffused += term
+                if (c1 + c2 <= tolerance * absolute(diffused).max(axis=0)).all():
+                    break
+                c1 = c2
+            diffused *= eta
+            term = diffused.copy()
+        return diffused
+
+    @staticmethod
+    def _krylov_expmv(matrix, heat_array, time,
+                      m=constants.KRYLOV_SUBSPACE_DIMENSION,
+                      tolerance=constants.KRYLOV_TOLERANCE):
+        """
+        Approximates ``expm(-time * matrix) * heat_array`` by running
+        `m` steps of Arnoldi (modified Gram-Schmidt) on ``-matrix`` and
+        exponentiating the small upper Hessenberg matrix that results
+
+        :param matrix: laplacian matrix
+        :type matrix: :py:class:`scipy.sparse.csr_matrix`
+        :param heat_array: input heat ordered by node index
+        :type heat_array: :py:class:`numpy.ndarray`
+        :param time: diffusion time
+        :type time: float
+        :param m: maximum dimension of Krylov subspace
+        :type m: int
+        :param tolerance: relative error above which approximation is
+                          rejected
+        :type tolerance: float
+        :return: diffused heat or ``None`` if estimated error
+                 exceeds `tolerance`
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        beta = numpy.linalg.norm(heat_array)
+        if beta == 0.0:
+            return numpy.zeros_like(heat_array)
+        m = min(m, matrix.shape[0])
+        basis = numpy.empty((m + 1, matrix.shape[0]), dtype=heat_array.dtype)
+        hessenberg = numpy.zeros((m + 1, m))
+        basis[0] = heat_array / beta
+        size = m
+        for j in range(m):
+            w = -matrix.dot(basis[j])
+            w_norm = numpy.linalg.norm(w)
+            for i in range(j + 1):
+                hessenberg[i, j] = numpy.dot(basis[i], w)
+                w -= hessenberg[i, j] * basis[i]
+            hessenberg[j + 1, j] = numpy.linalg.norm(w)
+            if hessenberg[j + 1, j] <= tolerance * w_norm:
+                # happy breakdown, subspace is invariant so result is exact
+                size = j + 1
+                break
+            basis[j + 1] = w / hessenberg[j + 1, j]
+
+        small_expm = expm(time * hessenberg[:size, :size])
+        if size == m:
+            error = beta * hessenberg[m, m - 1] * abs(small_expm[m - 1, 0])
+            if error > tolerance * beta:
+                return None
+        diffused = beta * basis[:size].T.dot(small_expm[:, 0])
+        return diffused.astype(heat_array.dtype, copy=False)
+
+    def _find_heat_from_cx(self, cxnetwork, node_index, heat_key):
         """
-        Gets node heat values from 'network' passed in
+        Gets node heat values from 'cxnetwork' passed in
 
-        :param network: network with nodes that contain 'heat_key' attribute
-        :type network: :py:class:`networkx.Graph`
+        :param cxnetwork: network with nodes that contain 'heat_key' attribute
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        :param node_index: node id to index in heat array
+        :type node_index: dict
         :param heat_key: name of heat key ie diffusion_input
         :type heat_key: str
         :return: array of heat values in order of index values
-                 of nodes in network
+                 in 'node_index'
         :rtype: :py:class:`numpy.ndarray`
         """
-        heat_list = []
-        found_heat = False
-        for node_id in network.nodes():
-            if heat_key in network.nodes[node_id]:
-                found_heat = True
-            heat_list.append(network.nodes[node_id].get(heat_key, 0))
-        if not found_heat:
+        node_heat = dict()
+        for node_id, n_attributes in cxnetwork.nodeAttributes.items():
+            if node_id not in node_index:
+                continue
+            for n_attr in n_attributes:
+                if n_attr['n'] == heat_key:
+                    node_heat[node_index[node_id]] = n_attr['v']
+        if not node_heat:
             raise HeatDiffusionError('No input heat found')
-        return numpy.array(heat_list, dtype=constants.DEFAULT_DATA_TYPE)
+        heat_array = numpy.zeros(len(node_index),
+                                 dtype=self._dtype)
+        heat_array[list(node_heat.keys())] = list(node_heat.values())
+        return heat_array
 
-    def _add_heat(self, network, heat_array,
+    def _add_heat(self, node_ids, heat_array,
                   correct_rank=False):
         """
-        Given a 'network' and an array of heats in 'heat_array' this
+        Given node ids in 'node_ids' and an array of heats in 'heat_array' this
         method returns a :py:class:`tuple` with two :py:class:`dict`
         objects.
 
@@ -105,10 +662,10 @@ class HeatDiffusion(object):
         node id and value being the rank where 0 is best
         rank and set to node with largest heat value.
 
-        :param network:
-        :type network: :py:class:`networkx.Graph`
+        :param node_ids: node ids in same order as 'heat_array'
+        :type node_ids: list
         :param heat_array: array of network node heats ordered by nodes
-                           in 'network'
+                           in 'node_ids'
         :type heat_array: :py:class:`numpy.ndarray`
         :param correct_rank: If True, multiple nodes that have same heat
                              will have same rank. The next node that has
@@ -119,75 +676,145 @@ class HeatDiffusion(object):
                   node rank as :py:class:`dict` with node id as key)
         :rtype: tuple
         """
-        node_heat = {node_id: heat_array[i] for i, node_id in enumerate(network.nodes())}
-        sorted_nodes = sorted(node_heat.items(), key=lambda x: x[1], reverse=True)
+        node_heat = dict(zip(node_ids, numpy.asarray(heat_array).tolist()))
+        rank_array = self._rank_heat(heat_array, correct_rank=correct_rank)
+        order = numpy.argsort(rank_array, kind='stable')
+        node_rank = dict(zip([node_ids[i] for i in order.tolist()],
+                             rank_array[order].tolist()))
+        return node_heat, node_rank
+
+    @staticmethod
+    def _rank_heat(heat_array, correct_rank=False):
+        """
+        Ranks heats in 'heat_array' where 0 is best rank and set
+        to node with largest heat value. Nodes with same heat
+        are ranked in the order they appear in 'heat_array'
+
+        :param heat_array: array of network node heats
+        :type heat_array: :py:class:`numpy.ndarray`
+        :param correct_rank: If True, multiple nodes that have same heat
+                             will have same rank. The next node that has
+                             a different heat will have a rank equal to the
+                             number of nodes before it
+        :type correct_rank: bool
+        :return: rank of each node in same order as 'heat_array'
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        # stable sort keeps nodes with same heat in node order
+        # which matches sorted(..., reverse=True)
+        order = numpy.argsort(-heat_array, kind='stable')
+        positions = numpy.arange(len(order))
 
         # this is a little correction that differs from REST service
         # where if multiple nodes have same heat value they are given
         # the same rank
         if correct_rank is True:
-            node_rank = dict()
-            rank = 0
-            counter = 0
-            previous_heat = None
-            for _, (node_id, heat) in enumerate(sorted_nodes):
-                if previous_heat is not None:
-                    if heat < previous_heat:
-                        rank = counter
-                node_rank[node_id] = rank
-                previous_heat = heat
-                counter += 1
+            sorted_heat = heat_array[order]
+            # a new rank starts wherever heat drops, every other node
+            # carries forward the position where its run of equal heats began
+            rank_start = numpy.ones(len(order), dtype=bool)
+            rank_start[1:] = sorted_heat[1:] < sorted_heat[:-1]
+            sorted_rank = numpy.maximum.accumulate(numpy.where(rank_start,
+                                                               positions, 0))
         else:
-            node_rank = {node_id: i for i, (node_id, _) in enumerate(sorted_nodes)}
+            sorted_rank = positions
+        rank_array = numpy.empty(len(order), dtype=positions.dtype)
+        rank_array[order] = sorted_rank
+        return rank_array
 
-        return node_heat, node_rank
-
-    def _add_diffusion_dict_to_network(self, cxnetwork, node_heat, node_rank,
-                                       heat_col_name=constants.DEFAULT_HEAT,
-                                       rank_col_name=constants.DEFAULT_RANK):
+    def _add_diffusion_arrays_to_network(self, cxnetwork, node_ids,
+                                         heat_array, rank_array,
+                                         heat_col_name=constants.DEFAULT_HEAT,
+                                         rank_col_name=constants.DEFAULT_RANK):
         """
-        Adds heat and rank as node attributes to 'cxnetwork' network
+        Adds heat and rank as node attributes to 'cxnetwork' network where
+        'heat_array' and 'rank_array' are ordered by nodes in 'node_ids'.
+        A heat or rank of `None` is skipped
 
         :param cxnetwork:
         :type cxnetwork: :py:class:`ndex2.nice_cx_network.NiceCXNetwork`
-        :param node_heat: :py:class:`dict` where key is node id and value is
-                          heat for that node
-        :type node_heat: dict
-        :param node_rank: :py:class:`dict` where key is node id and value is
-                          rank for that node
-        :type node_rank: dict
+        :param node_ids: node ids in same order as 'heat_array'
+                         and 'rank_array'
+        :type node_ids: list
+        :param heat_array: heat for each node
+        :type heat_array: :py:class:`numpy.ndarray` or list
+        :param rank_array: rank for each node
+        :type rank_array: :py:class:`numpy.ndarray` or list
         :return: 'cxnetwork' passed in
         """
-        for node_id, node_obj in cxnetwork.get_nodes():
-            if node_id in node_heat:
-                cxnetwork.add_node_attribute(property_of=node_id,
-                                             name=heat_col_name,
-                                             values=str(node_heat[node_id]),
-                                             type='double',
-                                             overwrite=True)
-            if node_id in node_rank:
-                cxnetwork.add_node_attribute(property_of=node_id,
-                                             name=rank_col_name,
-                                             values=str(node_rank[node_id]),
-                                             type='integer',
-                                             overwrite=True)
+        heat_array = self._values_to_strings(heat_array)
+        rank_array = self._values_to_strings(rank_array)
+
+        # attributes are appended directly to the nodeAttributes aspect
+        # which avoids the overhead of NiceCXNetwork.add_node_attribute()
+        # for every node, existing heat and rank attributes are replaced
+        node_attrs = cxnetwork.nodeAttributes
+        for node_id, heat, rank in zip(node_ids, heat_array, rank_array):
+            attrs = node_attrs.get(node_id)
+            if attrs is None:
+                attrs = []
+                node_attrs[node_id] = attrs
+            elif attrs:
+                attrs[:] = [a for a in attrs
+                            if not (heat is not None and
+                                    a['n'] == heat_col_name) and
+                            not (rank is not None and
+                                 a['n'] == rank_col_name)]
+            if heat is not None:
+                attrs.append({'po': node_id, 'n': heat_col_name,
+                              'v': heat, 'd': 'double'})
+            if rank is not None:
+                attrs.append({'po': node_id, 'n': rank_col_name,
+                              'v': rank, 'd': 'integer'})
         return cxnetwork
 
+    @staticmethod
+    def _values_to_strings(values):
+        """
+        Converts 'values' to a :py:class:`list` of strings in one
+        call to :py:func:`map` rather than a :py:func:`str` call per
+        value in a Python loop. `None` values are kept as `None`
+
+        :param values: values to convert
+        :type values: :py:class:`numpy.ndarray` or list
+        :return: string form of each value
+        :rtype: list
+        """
+        if isinstance(values, numpy.ndarray):
+            if values.dtype == numpy.float64 or\
+                    numpy.issubdtype(values.dtype, numpy.integer):
+                return list(map(str, values.tolist()))
+            # str() of the numpy scalar gives the shortest repr for
+            # its precision, a python float would add spurious digits
+            return list(map(str, values))
+        return [None if value is None else str(value) for value in values]
+
     def run_diffusion(self, cxnetwork, time_param=0.1,
                       normalize_laplacian=False,
                       input_col_name=constants.DEFAULT_INPUT,
                       output_prefix=constants.DEFAULT_OUTPUT_PREFIX,
                       correct_rank=False,
                       via_service=False,
-                      service_read_timeout=360):
+                      service_read_timeout=360,
+                      cache_laplacian=False):
         """
         Runs diffusion annotating the 'cxnetwork' passed in with
         new node attributes 'outputprefix'_heat and 'output_prefix'_rank
         added to 'cxnetwork' in place.
 
+        Edges are treated as undirected. Parallel edges between the same
+        pair of nodes are summed and the edge attribute ``weight``, if
+        set, is used as edge weight.
+
+        If 'cache_laplacian' is `True` the laplacian matrix of
+        'cxnetwork' is cached so later calls on the same network, for
+        example with different seeds or 'time_param', skip building it.
+        See :py:meth:`invalidate_cache`
+
         :param cxnetwork: network to run diffusion on
         :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
-        :param time_param: stop time passed to :py:func:`scipy.sparse.linalg.expm_multiply`
+        :param time_param: diffusion time, heat is computed as
+                           ``expm(-time_param * L) * input_heat``
         :type time_param: int
         :param normalize_laplacian: If `True`, will create a normalized
                                     laplacian matrix for diffusion.
@@ -215,6 +842,12 @@ class HeatDiffusion(object):
                                      from service. Only used when 'via_service' is
                                      set to `True`
         :type service_read_timeout: int
+        :param cache_laplacian: If `True`, cache laplacian of 'cxnetwork'
+                                for later calls. The network must not be
+                                modified while cached, other then its
+                                node attributes, unless
+                                :py:meth:`invalidate_cache` is called
+        :type cache_laplacian: bool
         :raises HeatDiffusionError: If network has no nodes and/or edges or
                                     there is an error
         :return: network passed in with diffusion columns added
@@ -229,23 +862,131 @@ class HeatDiffusion(object):
                                                    input_col_name=input_col_name,
                                                    output_prefix=output_prefix,
                                                    service_read_timeout=service_read_timeout)
+        num_nodes = self._check_network(cxnetwork)
+        node_index, laplacian = self._get_laplacian(cxnetwork,
+                                                    normalize=normalize_laplacian,
+                                                    use_cache=cache_laplacian)
+        heat_array = self._find_heat_from_cx(cxnetwork, node_index,
+                                             input_col_name)
+        diffused_heat_array = self._diffuse(laplacian, heat_array, time_param)
+        if LOGGER.isEnabledFor(logging.DEBUG) and\
+                numpy.ptp(diffused_heat_array) <= numpy.finfo(self._dtype).eps *\
+                numpy.abs(diffused_heat_array).max():
+            LOGGER.debug('Diffused heats are equal to within ' +
+                         str(self._dtype) + ' precision, ranks are '
+                         'determined by node order')
+        rank_array = self._rank_heat(diffused_heat_array,
+                                     correct_rank=correct_rank)
+        # nodes only referenced by edges are ranked but, as they are not
+        # in the nodes aspect, do not get attributes. They come last
+        # in 'node_index'
+        return self._add_diffusion_arrays_to_network(cxnetwork,
+                                                     list(islice(node_index,
+                                                                 num_nodes)),
+                                                     diffused_heat_array[:num_nodes],
+                                                     rank_array[:num_nodes])
+
+    def run_diffusion_batch(self, cxnetwork, heat_matrix, time_param=0.1,
+                            normalize_laplacian=False,
+                            correct_rank=False,
+                            cache_laplacian=False):
+        """
+        Runs diffusion of several sets of input heats on 'cxnetwork'
+        at once. The laplacian is built once and applied to every set
+        of heats in the same pass which is faster then calling
+        :py:meth:`run_diffusion` once per set. Unlike
+        :py:meth:`run_diffusion` 'cxnetwork' is not modified
+
+        :param cxnetwork: network to run diffusion on
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        :param heat_matrix: input heats either as a
+                            :py:class:`numpy.ndarray` with a row per node,
+                            in order of nodes in 'cxnetwork', and a column
+                            per diffusion or as a :py:class:`list` with a
+                            :py:class:`dict` of node id to heat per
+                            diffusion
+        :type heat_matrix: :py:class:`numpy.ndarray` or list
+        :param time_param: diffusion time, heat is computed as
+                           ``expm(-time_param * L) * input_heat``
+        :type time_param: float
+        :param normalize_laplacian: If `True`, will create a normalized
+                                    laplacian matrix for diffusion.
+        :type normalize_laplacian: bool
+        :param correct_rank: If True, multiple nodes that have same heat
+                             will have same rank
+        :type correct_rank: bool
+        :param cache_laplacian: If `True`, cache laplacian of 'cxnetwork'
+                                as done by :py:meth:`run_diffusion`
+        :type cache_laplacian: bool
+        :raises HeatDiffusionError: If network has no nodes and/or edges,
+                                    'heat_matrix' does not match the network
+                                    or has no heat
+        :return: (node heat as :py:class:`dict` with node id as key,
+                  node rank as :py:class:`dict` with node id as key)
+                 for each diffusion in order of 'heat_matrix'
+        :rtype: list
+        """
+        num_nodes = self._check_network(cxnetwork)
+        node_index, laplacian = self._get_laplacian(cxnetwork,
+                                                    normalize=normalize_laplacian,
+                                                    use_cache=cache_laplacian)
+        if isinstance(heat_matrix, numpy.ndarray):
+            if heat_matrix.ndim != 2 or heat_matrix.shape[0] != num_nodes:
+                raise HeatDiffusionError('heat_matrix must have shape (' +
+                                         str(num_nodes) + ', K) but has '
+                                         'shape ' + str(heat_matrix.shape))
+            heat_array = numpy.zeros((len(node_index), heat_matrix.shape[1]),
+                                     dtype=self._dtype)
+            # nodes only referenced by edges come last and get no heat
+            heat_array[:num_nodes] = heat_matrix
+        else:
+            heat_array = numpy.zeros((len(node_index), len(heat_matrix)),
+                                     dtype=self._dtype)
+            for k, node_heat in enumerate(heat_matrix):
+                for node_id, heat in node_heat.items():
+                    if node_id not in cxnetwork.nodes:
+                        raise HeatDiffusionError('Node ' + str(node_id) +
+                                                 ' not found in network')
+                    heat_array[node_index[node_id], k] = heat
+        if not heat_array.any():
+            raise HeatDiffusionError('No input heat found')
+
+        diffused_heat_array = self._diffuse(laplacian, heat_array, time_param)
+        node_ids = list(node_index)
+        extra_node_ids = node_ids[num_nodes:]
+        results = []
+        for k in range(diffused_heat_array.shape[1]):
+            node_heat, node_rank = self._add_heat(node_ids,
+                                                  diffused_heat_array[:, k],
+                                                  correct_rank=correct_rank)
+            for node_id in extra_node_ids:
+                del node_heat[node_id]
+                del node_rank[node_id]
+            results.append((node_heat, node_rank))
+        return results
+
+    @staticmethod
+    def _check_network(cxnetwork):
+        """
+        Checks 'cxnetwork' can be diffused locally
+
+        :param cxnetwork: network to check
+        :type cxnetwork: :py:class:`~ndex2.nice_cx_network.NiceCXNetwork`
+        :raises HeatDiffusionError: If network is `None` or has no nodes
+                                    and/or edges
+        :return: number of nodes in 'cxnetwork'
+        :rtype: int
+        """
         if cxnetwork is None:
             raise HeatDiffusionError('No network found')
 
-        if len(cxnetwork.get_nodes()) == 0:
+        num_nodes = len(cxnetwork.nodes)
+        if num_nodes == 0:
             raise HeatDiffusionError('No nodes found in network')
 
-        if len(cxnetwork.get_edges()) == 0:
+        if len(cxnetwork.edges) == 0:
             raise HeatDiffusionError('No edges found in network')
-
-        netx_fac = DefaultNetworkXFactory()
-        netx_graph = netx_fac.get_graph(cxnetwork, networkx_graph=networkx.MultiGraph())
-        matrix = self._create_sparse_matrix(netx_graph, normalize_laplacian)
-        heat_array = self._find_heat(netx_graph, input_col_name)
-        diffused_heat_array = self._diffuse(matrix, heat_array, time_param)
-        node_heat, node_rank = self._add_heat(netx_graph,
-                                              diffused_heat_array, correct_rank=correct_rank)
-        return self._add_diffusion_dict_to_network(cxnetwork, node_heat, node_rank)
+        return num_nodes
 
     def _run_diffusion_via_service(self, cxnetwork, time_param=None,
                                    normalize_laplacian=None,
@@ -308,11 +1049,12 @@ class HeatDiffusion(object):
                                       output_prefix=output_prefix)
         LOGGER.debug('Submitting request to ' + self._service_endpoint +
                      ' with params: ' + str(params))
-        resp = requests.post(self._service_endpoint,
-                             params=params,
-                             json=payload,
-                             timeout=(self._connect_timeout,
-                                      service_read_timeout))
+        resp = self._session.post(self._service_endpoint,
+                                  params=params,
+                                  data=self._serialize_payload(payload),
+                                  headers={'Content-Type': 'application/json'},
+                                  timeout=(self._connect_timeout,
+                                           service_read_timeout))
         LOGGER.debug('Received: ' + str(resp.status_code) +
                      ' response from service')
         if resp.status_code != 200:
@@ -322,9 +1064,64 @@ class HeatDiffusion(object):
                                      ') from call to diffusion service: ' +
                                      self._service_endpoint)
 
-        return self._append_diffusion_result_to_network(cxnetwork, resp.json(),
+        return self._append_diffusion_result_to_network(cxnetwork,
+                                                        self._deserialize_response(resp),
                                                         output_prefix)
 
+    @staticmethod
+    def _serialize_payload(payload):
+        """
+        Serializes 'payload' to JSON using :py:mod:`orjson` if it is
+        installed, which is several times faster then :py:mod:`json`
+        on large CX networks, otherwise :py:mod:`json` is used.
+
+        Either way ``NaN`` and infinite values are rejected as they
+        are not valid JSON
+
+        :param payload: data to serialize
+        :type payload: list
+        :raises HeatDiffusionError: If 'payload' contains ``NaN`` or
+                                    infinite values
+        :return: 'payload' as UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        if orjson is not None:
+            try:
+                data = orjson.dumps(payload)
+                # orjson writes NaN and infinity as null so any null
+                # is left to json to tell apart from None
+                if b'null' not in data:
+                    return data
+            except TypeError as te:
+                LOGGER.debug('orjson unable to serialize payload, '
+                             'using json: ' + str(te))
+        try:
+            return json.dumps(payload, allow_nan=False).encode('utf-8')
+        except ValueError as ve:
+            raise HeatDiffusionError('Unable to serialize network for '
+                                     'diffusion service: ' + str(ve))
+
+    @staticmethod
+    def _deserialize_response(resp):
+        """
+        Parses JSON body of 'resp' using :py:mod:`orjson` if it is
+        installed, otherwise :py:meth:`requests.Response.json` is used.
+        The latter is also used if :py:mod:`orjson` rejects the body, for
+        example if it contains ``NaN`` which only :py:mod:`json` accepts
+
+        :param resp: response from diffusion service
+        :type resp: :py:class:`requests.Response`
+        :return: parsed JSON
+        :rtype: dict
+        """
+        if orjson is not None:
+            try:
+                return orjson.loads(resp.content)
+            except ValueError as ve:
+                LOGGER.debug('orjson unable to parse response, '
+                             'using json: ' + str(ve))
+        return resp.json()
+
     @staticmethod
     def _convert_attribute_values_to_strings(cx_as_list_of_dictionaries):
         """
@@ -340,10 +1137,13 @@ class HeatDiffusion(object):
         """
         LOGGER.debug('Converting values of all attributes to type string')
         for p in cx_as_list_of_dictionaries:
-            k = list(p.keys())[0]
-            if 'Attributes' in k:
-                for i in range(len(p[k])):
-                    p[k][i]['v'] = str(p[k][i]['v'])
+            k = next(iter(p))
+            if k not in constants.CX_ATTRIBUTE_ASPECTS:
+                continue
+            for attr in p[k]:
+                value = attr['v']
+                if not isinstance(value, str):
+                    attr['v'] = str(value)
         return cx_as_list_of_dictionaries
 
     @staticmethod
@@ -383,22 +1183,34 @@ class HeatDiffusion(object):
         heat_col = o_prefix + constants.DEFAULT_HEAT_SUFFIX
 
         LOGGER.debug('Appending diffusion output to network')
-        for aspect in diff_res['data']:
-            if 'nodeAttributes' not in aspect:
-                continue
-            for n_attr in aspect['nodeAttributes']:
-                if n_attr['n'] == rank_col or n_attr['n'] == heat_col:
-                    if n_attr['d'] == 'float':
-                        n_type = 'double'
-                        val = n_attr['v']
-                    else:
-                        n_type = n_attr['d']
-                        val = n_attr['v']
-                    net_cx.add_node_attribute(property_of=int(n_attr['po']),
-                                              name=n_attr['n'],
-                                              values=val,
-                                              type=n_type,
-                                              overwrite=True)
+        wanted = frozenset((rank_col, heat_col))
+        results = [n_attr for aspect in diff_res['data']
+                   if 'nodeAttributes' in aspect
+                   for n_attr in aspect['nodeAttributes']
+                   if n_attr['n'] in wanted]
+
+        # service returns node ids as strings, convert them all at once
+        node_ids = numpy.asarray([n_attr['po'] for n_attr in results])
+        node_ids = node_ids.astype(numpy.int64).tolist()
+
+        # service reports heat as float which is double in CX
+        type_map = {'float': 'double'}
+
+        # same as add_node_attribute(..., overwrite=True) without the
+        # per call overhead
+        node_attrs = net_cx.nodeAttributes
+        for node_id, n_attr in zip(node_ids, results):
+            name = n_attr['n']
+            n_type = n_attr['d']
+            n_type = type_map.get(n_type, n_type)
+            attrs = node_attrs.get(node_id)
+            if attrs is None:
+                attrs = []
+                node_attrs[node_id] = attrs
+            elif attrs:
+                attrs[:] = [a for a in attrs if a['n'] != name]
+            attrs.append({'po': node_id, 'n': name,
+                          'v': n_attr['v'], 'd': n_type})
         LOGGER.debug('Network updated')
         return net_cx
 
@@ -500,49 +1312,59 @@ class HeatDiffusion(object):
         if seed_col is None:
             seed_col = constants.DEFAULT_INPUT
 
+        if max_rank is None and min_heat is None:
+            return cx_network
+
+        # index the needed attributes with one pass over nodeAttributes
+        # instead of a get_node_attribute() list scan per node and column
+        ranks = dict()
+        heats = dict()
+        seeds = dict()
+        for node_id, n_attributes in cx_network.nodeAttributes.items():
+            if node_id not in cx_network.nodes:
+                continue
+            for n_attr in n_attributes:
+                if n_attr['n'] == rank_col:
+                    ranks.setdefault(node_id, n_attr['v'])
+                if n_attr['n'] == heat_col:
+                    heats.setdefault(node_id, n_attr['v'])
+                if n_attr['n'] == seed_col:
+                    seeds.setdefault(node_id, n_attr['v'])
+
         nodes_to_remove = set()
-        for node_id, node_obj in cx_network.get_nodes():
-            if include_seeds is not None and include_seeds is True:
-                s_attr = cx_network.get_node_attribute(node_id, seed_col)
-                if s_attr is not None:
-                    if float(s_attr['v']) > 0.0:
-                        continue
-            if max_rank is not None:
-                n_attr = cx_network.get_node_attribute(node_id, rank_col)
-
-                if n_attr is not None and int(n_attr['v']) > max_rank:
-                    nodes_to_remove.add(node_id)
-                    continue
-            if min_heat is not None:
-                n_attr = cx_network.get_node_attribute(node_id, heat_col)
-                if n_attr is not None and float(n_attr['v']) < min_heat:
-                    nodes_to_remove.add(node_id)
-
-        edges_to_remove = set()
-        for edge_id, edge_obj in cx_network.get_edges():
-            if edge_obj['s'] in nodes_to_remove or edge_obj['t'] in nodes_to_remove:
-                edges_to_remove.add(edge_id)
+        if max_rank is not None and ranks:
+            rank_array = numpy.fromiter((int(v) for v in ranks.values()),
+                                        dtype=numpy.int64, count=len(ranks))
+            nodes_to_remove.update(compress(ranks.keys(),
+                                            rank_array > max_rank))
+        if min_heat is not None and heats:
+            heat_array = numpy.fromiter((float(v) for v in heats.values()),
+                                        dtype=numpy.float64, count=len(heats))
+            nodes_to_remove.update(compress(heats.keys(),
+                                            heat_array < min_heat))
+        if include_seeds is True and seeds:
+            seed_array = numpy.fromiter((float(v) for v in seeds.values()),
+                                        dtype=numpy.float64, count=len(seeds))
+            nodes_to_remove.difference_update(compress(seeds.keys(),
+                                                       seed_array > 0.0))
+
+        if not nodes_to_remove:
+            return cx_network
+
+        edges_to_remove = {edge_id for edge_id, edge_obj in cx_network.get_edges()
+                           if edge_obj['s'] in nodes_to_remove or
+                           edge_obj['t'] in nodes_to_remove}
 
+        # every attribute of a removed node or edge goes so the
+        # attribute lists are dropped in one step
+        edge_attributes = cx_network.edgeAttributes
         for edge_id in edges_to_remove:
-            e_attrib_names = set()
-            e_attributes = cx_network.get_edge_attributes(edge_id)
-            if e_attributes is not None:
-                for e_attr in e_attributes:
-                    e_attrib_names.add(e_attr['n'])
-                for e_name in e_attrib_names:
-                    cx_network.remove_edge_attribute(edge_id, e_name)
+            edge_attributes.pop(edge_id, None)
             cx_network.remove_edge(edge_id)
-            e_attrib_names.clear()
 
+        node_attributes = cx_network.nodeAttributes
         for node_id in nodes_to_remove:
-            n_attrib_names = set()
-            n_attributes = cx_network.get_node_attributes(node_id)
-            if n_attributes is not None:
-                for n_attr in n_attributes:
-                    n_attrib_names.add(n_attr['n'])
-                for n_name in n_attrib_names:
-                    cx_network.remove_node_attribute(node_id, n_name)
-            n_attrib_names.clear()
+            node_attributes.pop(node_id, None)
             cx_network.remove_node(node_id)
 
         cart_layout = cx_network.get_opaque_aspect('cartesianLayout')
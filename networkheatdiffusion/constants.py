@@ -41,7 +41,60 @@ DEFAULT_RANK = DEFAULT_OUTPUT_PREFIX + DEFAULT_RANK_SUFFIX
 Default rank attribute name
 """
 
+CX_ATTRIBUTE_ASPECTS = frozenset(('networkAttributes', 'nodeAttributes',
+                                  'edgeAttributes', 'hiddenAttributes',
+                                  'cyHiddenAttributes'))
+"""
+Names of CX aspects whose attribute values are sent to the diffusion
+service as strings
+"""
+
 DEFAULT_DATA_TYPE = numpy.float64
 """
 Default data type for :py:module:`scipy` and :py:mod:`numpy` operations
 """
+
+KRYLOV_NODE_THRESHOLD = 2000
+"""
+Networks with more nodes then this value are diffused using a
+Krylov subspace approximation of the matrix exponential action
+"""
+
+SPARSE_SEED_FRACTION = 0.01
+"""
+If fewer then this fraction of nodes have input heat, diffusion is
+restricted to the connected components that contain those nodes
+"""
+
+KRYLOV_SUBSPACE_DIMENSION = 30
+"""
+Maximum dimension of Krylov subspace built when diffusing large networks
+"""
+
+KRYLOV_TOLERANCE = 1e-12
+"""
+Relative error tolerated by Krylov subspace approximation before
+falling back to the truncated Taylor series in
+:py:meth:`~networkheatdiffusion.base.HeatDiffusion._taylor_expmv`
+"""
+
+TAYLOR_TOLERANCE = 2 ** -53
+"""
+Tolerance used to truncate Taylor series when computing
+action of matrix exponential (unit roundoff of double precision)
+"""
+
+TAYLOR_THETA = {1: 2.29e-16, 2: 2.58e-8, 3: 1.39e-5, 4: 3.40e-4,
+                5: 2.40e-3, 6: 9.07e-3, 7: 2.38e-2, 8: 5.00e-2,
+                9: 8.96e-2, 10: 1.44e-1, 11: 2.14e-1, 12: 3.00e-1,
+                13: 4.00e-1, 14: 5.14e-1, 15: 6.41e-1, 16: 7.81e-1,
+                17: 9.31e-1, 18: 1.09, 19: 1.26, 20: 1.44,
+                21: 1.62, 22: 1.82, 23: 2.01, 24: 2.22,
+                25: 2.43, 26: 2.64, 27: 2.86, 28: 3.08,
+                29: 3.31, 30: 3.54, 35: 4.7, 40: 6.0,
+                45: 7.2, 50: 8.5, 55: 9.9}
+"""
+Largest 1-norm, keyed by Taylor degree m, for which a degree m truncated
+Taylor series meets :py:const:`TAYLOR_TOLERANCE` (Al-Mohy and Higham 2011,
+Table 3.1, same values used by :py:func:`scipy.sparse.linalg.expm_multiply`)
+"""
@@ -10,14 +10,55 @@ Tests for `networkheatdiffusion` module.
 
 import os
 import sys
+import gc
+import json
+import pickle
 import unittest
+from unittest import mock
 import ndex2
+import requests
+import requests_mock
 import networkx
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import laplacian as csgraph_laplacian
+from scipy.sparse.linalg import expm_multiply
 
 from networkheatdiffusion import HeatDiffusion
 from networkheatdiffusion import HeatDiffusionError
 from networkheatdiffusion import constants
+from networkheatdiffusion.base import _CachedLaplacian
+
+
+def _networkx_laplacian(graph, normalize=False, dtype=np.float64):
+    """
+    Gets laplacian of networkx 'graph' as a CSR matrix of type 'dtype'
+    """
+    if normalize is True:
+        matrix = networkx.normalized_laplacian_matrix(graph)
+    else:
+        matrix = networkx.laplacian_matrix(graph)
+    return csr_matrix(matrix, dtype=dtype)
+
+
+def _nice_cx_from_networkx(graph):
+    """
+    Creates NiceCXNetwork with nodes and edges of networkx 'graph'
+    in the same order, setting edge attribute weight if present
+
+    :return: (network, :py:class:`dict` of networkx node to node id)
+    :rtype: tuple
+    """
+    net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+    node_ids = {node: net_cx.create_node(str(node)) for node in graph}
+    for source, target, data in graph.edges(data=True):
+        edge_id = net_cx.create_edge(edge_source=node_ids[source],
+                                     edge_target=node_ids[target])
+        if 'weight' in data:
+            net_cx.add_edge_attribute(property_of=edge_id, name='weight',
+                                      values=data['weight'], type='double')
+    return net_cx, node_ids
 
 
 class TestHeatDiffusion(unittest.TestCase):
@@ -43,14 +84,82 @@ class TestHeatDiffusion(unittest.TestCase):
         self.assertEqual('http://foo.com', diffuser._service_endpoint)
         self.assertEqual(10, diffuser._connect_timeout)
 
-    def test_create_sparse_matrix(self):
-        my_net = networkx.MultiGraph()
-        my_net.add_nodes_from([1, 2, 3])
-        my_net.add_edges_from([(1, 2),
-                               (1, 3)])
+    def test_diffusion_constructor_dtype(self):
+        diffuser = HeatDiffusion()
+        self.assertEqual(np.float64, diffuser._dtype)
+        diffuser = HeatDiffusion(dtype=np.float32)
+        self.assertEqual(np.float32, diffuser._dtype)
+        for dtype in [np.float16, np.longdouble, np.int64, int, None,
+                      'notatype']:
+            try:
+                HeatDiffusion(dtype=dtype)
+                self.fail('Expected HeatDiffusionError for ' + str(dtype))
+            except HeatDiffusionError as he:
+                self.assertTrue(str(he).startswith('dtype must be '
+                                                   'numpy.float32 or '
+                                                   'numpy.float64'))
+
+    def test_diffuse_float32(self):
+        diffuser = HeatDiffusion(dtype=np.float32)
+        # krylov and taylor paths
+        for num_nodes in [3000, 100]:
+            my_net = networkx.barabasi_albert_graph(num_nodes, 3, seed=1)
+            heat_array = np.zeros(num_nodes)
+            heat_array[[0, 20]] = 1.0
+            matrix = _networkx_laplacian(my_net)
+            expected = expm_multiply(-0.1 * matrix, heat_array)
+
+            matrix = _networkx_laplacian(my_net, dtype=np.float32)
+            res = diffuser._diffuse(_CachedLaplacian(matrix),
+                                    heat_array.astype(np.float32), 0.1)
+            self.assertEqual(np.float32, res.dtype)
+            self.assertTrue(np.allclose(expected, res, rtol=0, atol=1e-5))
+
+    def test_diffusion_float32(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion(dtype=np.float32)
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        res_cx = diffuser.run_diffusion(net_cx)
+        for node_id, node_obj in res_cx.get_nodes():
+            n_attr = res_cx.get_node_attribute(node_id, 'diffusion_output_rank')
+            if n_attr['v'] == '0':
+                self.assertEqual('E', node_obj['n'])
+            n_attr = res_cx.get_node_attribute(node_id, 'diffusion_output_heat')
+            # shortest repr of single precision value
+            self.assertTrue(len(n_attr['v']) <= 15)
+
+    def test_diffusion_float32_matches_float64(self):
+        heats = []
+        for dtype in [np.float64, np.float32]:
+            net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+            diffuser = HeatDiffusion(dtype=dtype)
+            diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+            res_cx = diffuser.run_diffusion(net_cx)
+            node_heats = []
+            for node_id, node_obj in res_cx.get_nodes():
+                n_attr = res_cx.get_node_attribute(node_id,
+                                                   'diffusion_output_heat')
+                node_heats.append(float(n_attr['v']))
+            heats.append(np.array(node_heats))
+        self.assertTrue(np.allclose(heats[0], heats[1], rtol=0, atol=1e-5))
+
+    def test_close(self):
+        diffuser = HeatDiffusion()
+        with mock.patch.object(diffuser._session, 'close') as mock_close:
+            diffuser.close()
+            mock_close.assert_called_once_with()
+
+    def test_laplacian_from_cx_star(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        node_three = net_cx.create_node('3')
+        net_cx.create_edge(edge_source=node_one, edge_target=node_two)
+        net_cx.create_edge(edge_source=node_one, edge_target=node_three)
 
         diffuser = HeatDiffusion()
-        res_array = diffuser._create_sparse_matrix(my_net).toarray()
+        node_index, matrix = diffuser._laplacian_from_cx(net_cx)
+        res_array = matrix.toarray()
 
         self.assertTrue(np.array_equal(np.array([2, -1, -1]),
                                        res_array[0]))
@@ -61,8 +170,9 @@ class TestHeatDiffusion(unittest.TestCase):
         self.assertTrue(np.array_equal(np.array([-1, 0, 1]),
                                        res_array[2]))
 
-        res_array = diffuser._create_sparse_matrix(my_net,
-                                                   normalize=True).toarray()
+        node_index, matrix = diffuser._laplacian_from_cx(net_cx,
+                                                         normalize=True)
+        res_array = matrix.toarray()
         self.assertTrue(np.isclose(np.array([1, -0.70710678, -0.70710678]),
                                    res_array[0]).all())
 
@@ -72,25 +182,220 @@ class TestHeatDiffusion(unittest.TestCase):
         self.assertTrue(np.isclose(np.array([-0.70710678, 0, 1]),
                                    res_array[2]).all())
 
-    def test_find_heat_no_heat_key(self):
-        my_net = networkx.MultiGraph()
-        my_net.add_nodes_from([1, 2, 3])
+        diffuser = HeatDiffusion(dtype=np.float32)
+        node_index, matrix = diffuser._laplacian_from_cx(net_cx)
+        self.assertEqual(np.float32, matrix.dtype)
+
+    def test_laplacian_from_cx_matches_networkx(self):
+        my_net = networkx.MultiGraph(networkx.barabasi_albert_graph(100, 3,
+                                                                    seed=1))
+        my_net.add_edge(0, 1)
+        my_net.add_edge(5, 5, weight=2.5)
+        my_net.add_edge(7, 9, weight=0.3)
+        my_net.add_node(100)
+        net_cx, node_ids = _nice_cx_from_networkx(my_net)
+        diffuser = HeatDiffusion()
+        node_index, res = diffuser._laplacian_from_cx(net_cx)
+        self.assertEqual([node_ids[node] for node in my_net],
+                         list(node_index))
+        self.assertTrue(np.allclose(networkx.laplacian_matrix(my_net).toarray(),
+                                    res.toarray()))
+        node_index, res = diffuser._laplacian_from_cx(net_cx, normalize=True)
+        expected = networkx.normalized_laplacian_matrix(my_net).toarray()
+        self.assertTrue(np.allclose(expected, res.toarray()))
 
+    def test_laplacian_from_edges_matches_csgraph(self):
+        rng = np.random.RandomState(1)
+        sources = rng.randint(0, 50, size=200)
+        targets = rng.randint(0, 50, size=200)
+        weights = rng.uniform(0.1, 2.0, size=200)
         diffuser = HeatDiffusion()
+        res = diffuser._laplacian_from_edges(sources, targets, weights, 60)
+        not_loop = sources != targets
+        adjacency = coo_matrix((np.concatenate((weights, weights[not_loop])),
+                                (np.concatenate((sources, targets[not_loop])),
+                                 np.concatenate((targets, sources[not_loop])))),
+                               shape=(60, 60)).tocsr()
+        # self loops cancel out of unnormalized laplacian
+        self.assertTrue(np.allclose(csgraph_laplacian(adjacency).toarray(),
+                                    res.toarray()))
+
+    def test_laplacian_from_cx(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        node_three = net_cx.create_node('3')
+        net_cx.create_edge(edge_source=node_one, edge_target=node_two)
+        net_cx.create_edge(edge_source=node_one, edge_target=node_two)
+        edge_id = net_cx.create_edge(edge_source=node_three,
+                                     edge_target=node_one)
+        net_cx.add_edge_attribute(property_of=edge_id, name='weight',
+                                  values='0.5', type='double')
+        net_cx.create_edge(edge_source=node_three, edge_target=node_three)
+
+        diffuser = HeatDiffusion()
+        node_index, matrix = diffuser._laplacian_from_cx(net_cx)
+        self.assertEqual({node_one: 0, node_two: 1, node_three: 2},
+                         node_index)
+        self.assertTrue(np.array_equal(np.array([[2.5, -2, -0.5],
+                                                 [-2, 2, 0],
+                                                 [-0.5, 0, 0.5]]),
+                                       matrix.toarray()))
+
+        netx_graph = networkx.MultiGraph()
+        netx_graph.add_nodes_from([node_one, node_two, node_three])
+        netx_graph.add_edges_from([(node_one, node_two),
+                                   (node_one, node_two),
+                                   (node_three, node_three)])
+        netx_graph.add_edge(node_three, node_one, weight=0.5)
+        expected = networkx.normalized_laplacian_matrix(netx_graph).toarray()
+        node_index, matrix = diffuser._laplacian_from_cx(net_cx,
+                                                         normalize=True)
+        self.assertTrue(np.allclose(expected, matrix.toarray()))
+
+    def test_find_heat_from_cx(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        net_cx.create_node('3')
+        net_cx.add_node_attribute(property_of=node_one, name='heat',
+                                  values=1.0, type='double')
+        net_cx.add_node_attribute(property_of=node_two, name='heat',
+                                  values='2.0', type='double')
+        node_index = {node_id: i for i, node_id in enumerate(net_cx.nodes)}
+        diffuser = HeatDiffusion()
+        res = diffuser._find_heat_from_cx(net_cx, node_index, 'heat')
+        self.assertTrue(np.array_equal(np.array([1, 2, 0]), res))
+
+        # integer heat
+        net_cx.set_node_attribute(node_one, 'heat', 3, type='integer',
+                                  overwrite=True)
+        res = diffuser._find_heat_from_cx(net_cx, node_index, 'heat')
+        self.assertTrue(np.array_equal(np.array([3, 2, 0]), res))
+
         try:
-            diffuser._find_heat(my_net, 'heat')
+            diffuser._find_heat_from_cx(net_cx, node_index, 'foo')
             self.fail('Expected HeatDiffusionError')
         except HeatDiffusionError as he:
             self.assertEqual('No input heat found', str(he))
 
-    def test_find_heat(self):
-        my_net = networkx.MultiGraph()
-        my_net.add_nodes_from([1, 2, 3])
-        node_attrs = {1: {'heat': 1}, 2: {'heat': 2}}
-        networkx.set_node_attributes(my_net, node_attrs)
+    def test_diffuse(self):
+        my_net = networkx.path_graph(50)
         diffuser = HeatDiffusion()
-        res = diffuser._find_heat(my_net, 'heat')
-        self.assertTrue(np.array_equal(np.array([1, 2, 0]), res))
+        matrix = _networkx_laplacian(my_net)
+        heat_array = np.zeros(50)
+        heat_array[[0, 20]] = 1.0
+        expected = expm_multiply(-matrix, heat_array, start=0,
+                                 stop=0.5, endpoint=True)[-1]
+        res = diffuser._diffuse(_CachedLaplacian(matrix), heat_array, 0.5)
+        self.assertTrue(np.allclose(expected, res, rtol=0, atol=1e-12))
+
+    def test_diffuse_restricted_to_seed_components(self):
+        my_net = networkx.disjoint_union(networkx.path_graph(50),
+                                         networkx.star_graph(149))
+        diffuser = HeatDiffusion()
+        matrix = _networkx_laplacian(my_net)
+        laplacian = _CachedLaplacian(matrix)
+        heat_array = np.zeros(200)
+        heat_array[10] = 1.0
+        expected = expm_multiply(-0.5 * matrix, heat_array)
+        res = diffuser._diffuse(laplacian, heat_array, 0.5)
+        self.assertTrue(np.allclose(expected, res, rtol=0, atol=1e-12))
+        self.assertTrue(np.all(res[50:] == 0.0))
+
+        indices, sub_laplacian = laplacian.get_seed_components(np.array([10]))
+        self.assertEqual(list(range(50)), indices.tolist())
+        self.assertEqual(50, sub_laplacian.num_nodes)
+        # same components reuse the sub laplacian
+        self.assertTrue(sub_laplacian is
+                        laplacian.get_seed_components(np.array([3, 7]))[1])
+
+        # seeds in every component, nothing to restrict
+        self.assertIsNone(laplacian.get_seed_components(np.array([10, 60])))
+
+        # only the most recent components are kept
+        indices, sub_laplacian = laplacian.get_seed_components(np.array([60]))
+        self.assertEqual(list(range(50, 200)), indices.tolist())
+        self.assertTrue(sub_laplacian is laplacian._seed_components[1][1])
+
+    def test_taylor_expmv(self):
+        diffuser = HeatDiffusion()
+        for my_net in [networkx.barabasi_albert_graph(100, 3, seed=1),
+                       networkx.star_graph(99)]:
+            for normalize in [False, True]:
+                matrix = _networkx_laplacian(my_net, normalize=normalize)
+                laplacian = _CachedLaplacian(matrix, normalized=normalize)
+                heat_array = np.zeros(100)
+                heat_array[[0, 20]] = 1.0
+                for time in [0.0, 0.1, 1.0, 10.0]:
+                    expected = expm_multiply(-time * matrix, heat_array)
+                    res = diffuser._taylor_expmv(laplacian, heat_array, time)
+                    self.assertTrue(np.allclose(expected, res,
+                                                rtol=0, atol=1e-12))
+                # parameters computed once per time value
+                self.assertEqual(4, len(laplacian._taylor_parameters))
+
+    def test_diffuse_multiple_heat_columns(self):
+        diffuser = HeatDiffusion()
+        # taylor and krylov paths
+        for num_nodes in [100, 3000]:
+            my_net = networkx.barabasi_albert_graph(num_nodes, 3, seed=1)
+            matrix = _networkx_laplacian(my_net)
+            laplacian = _CachedLaplacian(matrix)
+            heat_array = np.zeros((num_nodes, 3))
+            heat_array[[0, 20], 0] = 1.0
+            heat_array[5, 1] = 1e-6
+            heat_array[:, 2] = 0.5
+            res = diffuser._diffuse(laplacian, heat_array, 0.5)
+            self.assertEqual((num_nodes, 3), res.shape)
+            for k in range(3):
+                expected = expm_multiply(-0.5 * matrix, heat_array[:, k])
+                self.assertTrue(np.allclose(expected, res[:, k], rtol=1e-12,
+                                            atol=0))
+
+    def test_cached_laplacian_get_shifted_matrix(self):
+        matrix = _networkx_laplacian(networkx.path_graph(4))
+        laplacian = _CachedLaplacian(matrix)
+        shifted = laplacian.get_shifted_matrix()
+        self.assertTrue(np.allclose(1.5 * np.eye(4) - matrix.toarray(),
+                                    shifted.toarray()))
+        self.assertTrue(shifted is laplacian.get_shifted_matrix())
+
+    def test_cached_laplacian_get_norm(self):
+        my_net = networkx.star_graph(99)
+        matrix = _networkx_laplacian(my_net)
+        laplacian = _CachedLaplacian(matrix)
+        # 2 * max degree - mu
+        self.assertAlmostEqual(198 - 1.98, laplacian.get_norm())
+
+        matrix = _networkx_laplacian(my_net, normalize=True)
+        laplacian = _CachedLaplacian(matrix, normalized=True)
+        self.assertAlmostEqual(1.0, laplacian.get_norm())
+
+        # negative weight, falls back to 1-norm of shifted matrix
+        my_net = networkx.Graph()
+        my_net.add_edge(0, 1, weight=-1.0)
+        my_net.add_edge(1, 2, weight=2.0)
+        laplacian = _CachedLaplacian(_networkx_laplacian(my_net))
+        self.assertAlmostEqual(10.0 / 3.0, laplacian.get_norm())
+
+    def test_krylov_expmv(self):
+        my_net = networkx.path_graph(50)
+        diffuser = HeatDiffusion()
+        matrix = _networkx_laplacian(my_net)
+        heat_array = np.zeros(50)
+        heat_array[[0, 20]] = 1.0
+        expected = expm_multiply(-0.5 * matrix, heat_array)
+        res = diffuser._krylov_expmv(matrix, heat_array, 0.5)
+        self.assertTrue(np.allclose(expected, res, rtol=0, atol=1e-12))
+
+        # too small a subspace to converge
+        self.assertIsNone(diffuser._krylov_expmv(matrix, heat_array,
+                                                 5.0, m=2))
+
+        # no heat
+        res = diffuser._krylov_expmv(matrix, np.zeros(50), 0.5)
+        self.assertTrue(np.array_equal(np.zeros(50), res))
 
     def test_diffusion_none_passed_in_as_network(self):
         net_cx = ndex2.nice_cx_network.NiceCXNetwork()
@@ -133,6 +438,173 @@ class TestHeatDiffusion(unittest.TestCase):
             n_attr = res_cx.get_node_attribute(node_id, 'diffusion_output_heat')
             self.assertIsNotNone(n_attr)
 
+    def test_diffusion_parallel_edges_summed(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        node_three = net_cx.create_node('3')
+        net_cx.create_edge(edge_source=node_one, edge_target=node_two)
+        net_cx.create_edge(edge_source=node_two, edge_target=node_one)
+        net_cx.create_edge(edge_source=node_two, edge_target=node_three)
+        net_cx.add_node_attribute(property_of=node_one,
+                                  name=constants.DEFAULT_INPUT,
+                                  values=1.0, type='double')
+        diffuser = HeatDiffusion()
+        res_cx = diffuser.run_diffusion(net_cx, time_param=0.5)
+
+        netx_graph = networkx.MultiGraph()
+        netx_graph.add_nodes_from([node_one, node_two, node_three])
+        netx_graph.add_edges_from([(node_one, node_two),
+                                   (node_two, node_one),
+                                   (node_two, node_three)])
+        matrix = networkx.laplacian_matrix(netx_graph).astype(float)
+        expected = expm_multiply(-0.5 * matrix, np.array([1.0, 0.0, 0.0]))
+        for i, node_id in enumerate([node_one, node_two, node_three]):
+            n_attr = res_cx.get_node_attribute(node_id,
+                                               constants.DEFAULT_HEAT)
+            self.assertAlmostEqual(expected[i], float(n_attr['v']))
+
+    def test_diffusion_laplacian_cache(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        node_ids = list(net_cx.nodes)
+        with mock.patch.object(diffuser, '_laplacian_from_cx',
+                               wraps=diffuser._laplacian_from_cx) as mock_lap:
+            diffuser.run_diffusion(net_cx, cache_laplacian=True)
+            first_heat = net_cx.get_node_attribute(node_ids[0],
+                                                   constants.DEFAULT_HEAT)
+            diffuser.run_diffusion(net_cx, cache_laplacian=True)
+            self.assertEqual(first_heat,
+                             net_cx.get_node_attribute(node_ids[0],
+                                                       constants.DEFAULT_HEAT))
+            self.assertEqual(1, mock_lap.call_count)
+
+            diffuser.run_diffusion(net_cx, normalize_laplacian=True,
+                                   cache_laplacian=True)
+            self.assertEqual(2, mock_lap.call_count)
+
+            # network changed so laplacian is rebuilt
+            net_cx.create_edge(edge_source=node_ids[0],
+                               edge_target=node_ids[1])
+            diffuser.run_diffusion(net_cx, cache_laplacian=True)
+            self.assertEqual(3, mock_lap.call_count)
+
+            diffuser.invalidate_cache(net_cx)
+            diffuser.run_diffusion(net_cx, cache_laplacian=True)
+            self.assertEqual(4, mock_lap.call_count)
+
+            diffuser.invalidate_cache()
+            self.assertEqual(0, len(diffuser._laplacian_cache))
+
+        # cache does not keep network alive
+        diffuser.run_diffusion(net_cx, cache_laplacian=True)
+        self.assertEqual(1, len(diffuser._laplacian_cache))
+        # mock holds network in its call arguments
+        del net_cx, mock_lap
+        gc.collect()
+        self.assertEqual(0, len(diffuser._laplacian_cache))
+
+    def test_diffusion_laplacian_not_cached_by_default(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        diffuser.run_diffusion(net_cx)
+        self.assertEqual(0, len(diffuser._laplacian_cache))
+
+        # weight change keeps number of nodes, edges and edge attributes
+        edge_id = next(iter(net_cx.edgeAttributes))
+        net_cx.add_edge_attribute(property_of=edge_id, name='weight',
+                                  values=10.0, type='double')
+        diffuser.run_diffusion(net_cx)
+        res = {node_id: net_cx.get_node_attribute(node_id,
+                                                  constants.DEFAULT_HEAT)['v']
+               for node_id in net_cx.nodes}
+
+        HeatDiffusion().run_diffusion(net_cx)
+        for node_id in net_cx.nodes:
+            self.assertEqual(res[node_id],
+                             net_cx.get_node_attribute(node_id,
+                                                       constants.DEFAULT_HEAT)['v'])
+
+    def test_pickle(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion(service_endpoint='http://foo.com',
+                                 dtype=np.float32)
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        diffuser.run_diffusion(net_cx, cache_laplacian=True)
+        self.assertEqual(1, len(diffuser._laplacian_cache))
+
+        res = pickle.loads(pickle.dumps(diffuser))
+        self.assertEqual('http://foo.com', res._service_endpoint)
+        self.assertEqual(np.float32, res._dtype)
+        self.assertEqual(0, len(res._laplacian_cache))
+        res.run_diffusion(net_cx, cache_laplacian=True)
+        self.assertEqual(1, len(res._laplacian_cache))
+
+    def test_run_diffusion_batch(self):
+        diffuser = HeatDiffusion()
+        expected = []
+        for seed_nodes in [['E', 'M'], ['E']]:
+            net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+            diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=seed_nodes)
+            diffuser.run_diffusion(net_cx, correct_rank=True)
+            expected.append({node_id: net_cx.get_node_attribute(node_id,
+                                                                constants.DEFAULT_HEAT)['v']
+                             for node_id in net_cx.nodes})
+
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        name_to_id = {node_obj['n']: node_id for node_id, node_obj
+                      in net_cx.get_nodes()}
+        res = diffuser.run_diffusion_batch(net_cx,
+                                           [{name_to_id['E']: 1.0,
+                                             name_to_id['M']: 1.0},
+                                            {name_to_id['E']: 1.0}],
+                                           correct_rank=True)
+        self.assertEqual(2, len(res))
+        for (node_heat, node_rank), exp_heat in zip(res, expected):
+            self.assertEqual(set(exp_heat.keys()), set(node_heat.keys()))
+            for node_id, heat in node_heat.items():
+                self.assertAlmostEqual(float(exp_heat[node_id]), heat,
+                                       places=12)
+            self.assertEqual(0, node_rank[name_to_id['E']])
+        # network is not modified
+        self.assertIsNone(net_cx.get_node_attribute(name_to_id['E'],
+                                                    constants.DEFAULT_HEAT))
+
+        heat_matrix = np.zeros((len(net_cx.nodes), 2))
+        node_ids = list(net_cx.nodes)
+        heat_matrix[node_ids.index(name_to_id['E']), :] = 1.0
+        heat_matrix[node_ids.index(name_to_id['M']), 0] = 1.0
+        array_res = diffuser.run_diffusion_batch(net_cx, heat_matrix,
+                                                 correct_rank=True)
+        self.assertEqual(res, array_res)
+
+    def test_run_diffusion_batch_errors(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        try:
+            diffuser.run_diffusion_batch(net_cx, np.zeros((3, 2)))
+            self.fail('Expected HeatDiffusionError')
+        except HeatDiffusionError as he:
+            self.assertEqual('heat_matrix must have shape (359, K) but '
+                             'has shape (3, 2)', str(he))
+        try:
+            diffuser.run_diffusion_batch(net_cx, [{-1: 1.0}])
+            self.fail('Expected HeatDiffusionError')
+        except HeatDiffusionError as he:
+            self.assertEqual('Node -1 not found in network', str(he))
+        try:
+            diffuser.run_diffusion_batch(net_cx, np.zeros((359, 2)))
+            self.fail('Expected HeatDiffusionError')
+        except HeatDiffusionError as he:
+            self.assertEqual('No input heat found', str(he))
+        try:
+            diffuser.run_diffusion_batch(None, [])
+            self.fail('Expected HeatDiffusionError')
+        except HeatDiffusionError as he:
+            self.assertEqual('No network found', str(he))
+
     def test_extract_diffused_subnetwork_by_rank(self):
         net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
         diffuser = HeatDiffusion()
@@ -160,19 +632,53 @@ class TestHeatDiffusion(unittest.TestCase):
         self.assertEqual(8, len(filtered_cx.get_nodes()))
         self.assertEqual(6, len(filtered_cx.get_edges()))
 
+    def test_extract_diffused_subnetwork_by_rank_include_seeds(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        res_cx = diffuser.run_diffusion(net_cx)
+        filtered_cx = diffuser.extract_diffused_subnetwork_by_rank(res_cx,
+                                                                   max_rank=0,
+                                                                   include_seeds=True)
+        self.assertEqual(['E', 'M'],
+                         sorted([node_obj['n'] for node_id, node_obj
+                                 in filtered_cx.get_nodes()]))
+        self.assertEqual(0, len(filtered_cx.get_edges()))
+        self.assertEqual(2, len(filtered_cx.get_opaque_aspect('cartesianLayout')))
+
+    def test_extract_diffused_subnetwork_by_rank_nothing_removed(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        res_cx = diffuser.run_diffusion(net_cx)
+        layout = res_cx.get_opaque_aspect('cartesianLayout')
+        filtered_cx = diffuser.extract_diffused_subnetwork_by_rank(res_cx)
+        self.assertEqual(359, len(filtered_cx.get_nodes()))
+        self.assertEqual(481, len(filtered_cx.get_edges()))
+
+        filtered_cx = diffuser.extract_diffused_subnetwork_by_rank(res_cx,
+                                                                   max_rank=1000)
+        self.assertEqual(359, len(filtered_cx.get_nodes()))
+        self.assertEqual(481, len(filtered_cx.get_edges()))
+        self.assertTrue(layout is
+                        filtered_cx.get_opaque_aspect('cartesianLayout'))
+
+    def test_extract_diffused_subnetwork_by_rank_removes_attributes(self):
+        net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
+        diffuser = HeatDiffusion()
+        diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
+        res_cx = diffuser.run_diffusion(net_cx)
+        filtered_cx = diffuser.extract_diffused_subnetwork_by_rank(res_cx,
+                                                                   max_rank=5)
+        self.assertEqual(set(filtered_cx.nodes),
+                         set(filtered_cx.nodeAttributes.keys()))
+        for edge_id in filtered_cx.edgeAttributes.keys():
+            self.assertTrue(edge_id in filtered_cx.edges)
+
     def test_extract_diffused_subnetwork_by_rank_no_edge_attributes(self):
         net_cx = ndex2.create_nice_cx_from_file(TestHeatDiffusion.TEST_NETWORK)
 
-        for edge_id, edge_obj in net_cx.get_edges():
-            e_attributes = net_cx.get_edge_attributes(edge_id)
-            if e_attributes is None:
-                continue
-            e_attrib_names = set()
-            for e_attr in e_attributes:
-                e_attrib_names.add(e_attr['n'])
-            for e_name in e_attrib_names:
-                net_cx.remove_edge_attribute(edge_id, e_name)
-            e_attrib_names.clear()
+        net_cx.edgeAttributes.clear()
         diffuser = HeatDiffusion()
         diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
         res_cx = diffuser.run_diffusion(net_cx)
@@ -189,17 +695,21 @@ class TestHeatDiffusion(unittest.TestCase):
         my_net.add_nodes_from([1, 2, 3])
 
         diffuser = HeatDiffusion()
-        node_heat, node_rank = diffuser._add_heat(my_net,
+        node_heat, node_rank = diffuser._add_heat(list(my_net.nodes()),
                                                   np.array([2, 3, 1]))
         self.assertEqual({1: 2, 2: 3, 3: 1}, node_heat)
         self.assertEqual({2: 0, 1: 1, 3: 2}, node_rank)
+        # plain python values, not numpy scalars
+        self.assertEqual({int}, set(type(v) for v in node_heat.values()))
+        self.assertEqual({int}, set(type(v) for v in node_rank.values()))
+        self.assertEqual([2, 1, 3], list(node_rank.keys()))
 
     def test_add_heat_with_correct_rank_true_no_equal_heats(self):
         my_net = networkx.MultiGraph()
         my_net.add_nodes_from([1, 2, 3])
 
         diffuser = HeatDiffusion()
-        node_heat, node_rank = diffuser._add_heat(my_net,
+        node_heat, node_rank = diffuser._add_heat(list(my_net.nodes()),
                                                   np.array([2, 3, 1]),
                                                   correct_rank=True)
         self.assertEqual({1: 2, 2: 3, 3: 1}, node_heat)
@@ -210,7 +720,7 @@ class TestHeatDiffusion(unittest.TestCase):
         my_net.add_nodes_from([1, 2, 3, 4])
 
         diffuser = HeatDiffusion()
-        node_heat, node_rank = diffuser._add_heat(my_net,
+        node_heat, node_rank = diffuser._add_heat(list(my_net.nodes()),
                                                   np.array([2, 3, 2, 1]),
                                                   correct_rank=True)
         self.assertEqual({1: 2, 2: 3, 3: 2, 4: 1}, node_heat)
@@ -221,7 +731,7 @@ class TestHeatDiffusion(unittest.TestCase):
         my_net.add_nodes_from([1, 2, 3, 4])
 
         diffuser = HeatDiffusion()
-        node_heat, node_rank = diffuser._add_heat(my_net,
+        node_heat, node_rank = diffuser._add_heat(list(my_net.nodes()),
                                                   np.array([2, 2, 2, 2]),
                                                   correct_rank=True)
         self.assertEqual({1: 2, 2: 2, 3: 2, 4: 2}, node_heat)
@@ -232,12 +742,82 @@ class TestHeatDiffusion(unittest.TestCase):
         my_net.add_nodes_from([1, 2, 3, 4, 5, 6])
 
         diffuser = HeatDiffusion()
-        node_heat, node_rank = diffuser._add_heat(my_net,
+        node_heat, node_rank = diffuser._add_heat(list(my_net.nodes()),
                                                   np.array([3, 3, 5, 5, 7, 2]),
                                                   correct_rank=True)
         self.assertEqual({1: 3, 2: 3, 3: 5, 5: 5, 4: 5, 5: 7, 6: 2}, node_heat)
         self.assertEqual({5: 0, 3: 1, 4: 1, 1: 3, 2: 3, 6: 5}, node_rank)
 
+    def test_rank_heat(self):
+        diffuser = HeatDiffusion()
+        res = diffuser._rank_heat(np.array([3, 3, 5, 5, 7, 2]))
+        self.assertEqual([3, 4, 1, 2, 0, 5], res.tolist())
+        res = diffuser._rank_heat(np.array([3, 3, 5, 5, 7, 2]),
+                                  correct_rank=True)
+        self.assertEqual([3, 3, 1, 1, 0, 5], res.tolist())
+
+    def test_values_to_strings(self):
+        diffuser = HeatDiffusion()
+        self.assertEqual(['0.1', '0.30000000000000004'],
+                         diffuser._values_to_strings(np.array([0.1,
+                                                               0.1 + 0.2])))
+        self.assertEqual(['0.1'], diffuser._values_to_strings(
+            np.array([0.1], dtype=np.float32)))
+        self.assertEqual(['3', '0'],
+                         diffuser._values_to_strings(np.array([3, 0])))
+        self.assertEqual(['0.5', None, '2'],
+                         diffuser._values_to_strings([0.5, None, 2]))
+
+    def test_add_diffusion_arrays_to_network(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        diffuser = HeatDiffusion()
+        res = diffuser._add_diffusion_arrays_to_network(net_cx,
+                                                        [node_one, node_two],
+                                                        np.array([0.25, 0.75]),
+                                                        np.array([1, 0]),
+                                                        heat_col_name='h',
+                                                        rank_col_name='r')
+        self.assertEqual([{'po': node_one, 'n': 'h', 'v': '0.25',
+                           'd': 'double'},
+                          {'po': node_one, 'n': 'r', 'v': '1',
+                           'd': 'integer'}],
+                         res.get_node_attributes(node_one))
+        self.assertEqual([{'po': node_two, 'n': 'h', 'v': '0.75',
+                           'd': 'double'},
+                          {'po': node_two, 'n': 'r', 'v': '0',
+                           'd': 'integer'}],
+                         res.get_node_attributes(node_two))
+
+    def test_add_diffusion_arrays_to_network_replaces_existing(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        node_three = net_cx.create_node('3')
+        net_cx.add_node_attribute(property_of=node_one,
+                                  name=constants.DEFAULT_INPUT,
+                                  values=1.0, type='double')
+        net_cx.add_node_attribute(property_of=node_one,
+                                  name=constants.DEFAULT_HEAT,
+                                  values='0.5', type='double')
+        diffuser = HeatDiffusion()
+        res = diffuser._add_diffusion_arrays_to_network(net_cx,
+                                                        [node_one, node_two],
+                                                        [0.75, 0.25],
+                                                        [0, None])
+        self.assertEqual([{'po': node_one, 'n': constants.DEFAULT_INPUT,
+                           'v': 1.0, 'd': 'double'},
+                          {'po': node_one, 'n': constants.DEFAULT_HEAT,
+                           'v': '0.75', 'd': 'double'},
+                          {'po': node_one, 'n': constants.DEFAULT_RANK,
+                           'v': '0', 'd': 'integer'}],
+                         res.get_node_attributes(node_one))
+        self.assertEqual([{'po': node_two, 'n': constants.DEFAULT_HEAT,
+                           'v': '0.25', 'd': 'double'}],
+                         res.get_node_attributes(node_two))
+        self.assertIsNone(res.get_node_attributes(node_three))
+
     def test_convert_attribute_values_to_strings_where_change_needed(self):
         net_cx = ndex2.nice_cx_network.NiceCXNetwork()
         node_id = net_cx.create_node('foo')
@@ -266,6 +846,216 @@ class TestHeatDiffusion(unittest.TestCase):
         self.assertTrue(isinstance(val, str))
         self.assertEqual('foo', val)
 
+    def test_convert_attribute_values_to_strings_various_types(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_id = net_cx.create_node('foo')
+        edge_id = net_cx.create_edge(edge_source=node_id, edge_target=node_id)
+        net_cx.add_node_attribute(property_of=node_id, name='double',
+                                  values=0.1, type='double')
+        net_cx.add_node_attribute(property_of=node_id, name='bool',
+                                  values=True, type='boolean')
+        net_cx.add_node_attribute(property_of=node_id, name='list',
+                                  values=['a', 'b'], type='list_of_string')
+        net_cx.add_edge_attribute(property_of=edge_id, name='weight',
+                                  values=2, type='integer')
+        net_cx.set_network_attribute('version', values=1.5, type='double')
+        diffuser = HeatDiffusion()
+        res = diffuser._convert_attribute_values_to_strings(net_cx.to_cx())
+        values = dict()
+        for aspect in res:
+            for aspect_name in ['nodeAttributes', 'edgeAttributes',
+                                'networkAttributes']:
+                for attr in aspect.get(aspect_name, []):
+                    values[attr['n']] = attr['v']
+        self.assertEqual({'double': '0.1', 'bool': 'True',
+                          'list': "['a', 'b']", 'weight': '2',
+                          'version': '1.5'}, values)
+
+        # non attribute aspects are left alone
+        for aspect in res:
+            if 'nodes' in aspect:
+                self.assertEqual('foo', aspect['nodes'][0]['n'])
+                self.assertTrue(isinstance(aspect['nodes'][0]['@id'], int))
+
+    def test_convert_attribute_values_to_strings_mixed_types(self):
+        cx = [{'nodeAttributes': [{'po': 0, 'n': 'x', 'v': 'foo'},
+                                  {'po': 1, 'n': 'x', 'v': 2},
+                                  {'po': 2, 'n': 'x', 'v': 'bar'},
+                                  {'po': 3, 'n': 'x', 'v': 1.5}]}]
+        diffuser = HeatDiffusion()
+        res = diffuser._convert_attribute_values_to_strings(cx)
+        self.assertEqual(['foo', '2', 'bar', '1.5'],
+                         [attr['v'] for attr in res[0]['nodeAttributes']])
+
+    def test_convert_attribute_values_to_strings_only_attribute_aspects(self):
+        cx = [{'networkAttributes': [{'n': 'x', 'v': 1}]},
+              {'edgeAttributes': [{'po': 0, 'n': 'x', 'v': 2}]},
+              {'cyHiddenAttributes': [{'n': 'x', 'v': True}]},
+              {'myAttributesAspect': [{'n': 'x', 'v': 3}]}]
+        diffuser = HeatDiffusion()
+        res = diffuser._convert_attribute_values_to_strings(cx)
+        self.assertEqual('1', res[0]['networkAttributes'][0]['v'])
+        self.assertEqual('2', res[1]['edgeAttributes'][0]['v'])
+        self.assertEqual('True', res[2]['cyHiddenAttributes'][0]['v'])
+        self.assertEqual(3, res[3]['myAttributesAspect'][0]['v'])
+
+    def test_convert_attribute_values_to_strings_full_precision(self):
+        vals = [0.1 + 0.2, 1e-20, 123456789.123456789, 2 ** 60, -0.0]
+        cx = [{'nodeAttributes': [{'po': i, 'n': 'x', 'v': v}
+                                  for i, v in enumerate(vals)]}]
+        diffuser = HeatDiffusion()
+        res = diffuser._convert_attribute_values_to_strings(cx)
+        strs = [attr['v'] for attr in res[0]['nodeAttributes']]
+        self.assertEqual(['0.30000000000000004', '1e-20',
+                          '123456789.12345679', '1152921504606846976',
+                          '-0.0'], strs)
+        # values must survive the round trip to the service unchanged
+        for v, s in zip(vals, strs):
+            self.assertEqual(v, type(v)(s))
+
+    def test_serialize_payload(self):
+        payload = [{'nodes': [{'@id': 0, 'n': 'foo'}]},
+                   {'nodeAttributes': [{'po': 0, 'n': 'x', 'v': '1.5'}]}]
+        diffuser = HeatDiffusion()
+        res = diffuser._serialize_payload(payload)
+        self.assertTrue(isinstance(res, bytes))
+        self.assertEqual(payload, json.loads(res.decode('utf-8')))
+
+        with mock.patch('networkheatdiffusion.base.orjson', None):
+            res = diffuser._serialize_payload(payload)
+        self.assertTrue(isinstance(res, bytes))
+        self.assertEqual(payload, json.loads(res.decode('utf-8')))
+
+    def test_serialize_payload_nan_and_none(self):
+        diffuser = HeatDiffusion()
+        payload = [{'cartesianLayout': [{'node': 0, 'x': None, 'y': 1.0}]}]
+        bad_payloads = [[{'cartesianLayout': [{'node': 0, 'x': value,
+                                               'y': 1.0}]}]
+                        for value in [float('nan'), float('inf')]]
+
+        def check_serialize():
+            # None is valid JSON
+            res = diffuser._serialize_payload(payload)
+            self.assertEqual(payload, json.loads(res.decode('utf-8')))
+            for bad_payload in bad_payloads:
+                try:
+                    diffuser._serialize_payload(bad_payload)
+                    self.fail('Expected HeatDiffusionError')
+                except HeatDiffusionError as he:
+                    self.assertTrue(str(he).startswith('Unable to serialize'))
+
+        check_serialize()
+        with mock.patch('networkheatdiffusion.base.orjson', None):
+            check_serialize()
+
+    def test_append_diffusion_result_to_network(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        net_cx.add_node_attribute(property_of=node_one, name='foo_heat',
+                                  values='0.1', type='double')
+        diff_res = {'data': [{'nodeAttributes': [{'po': str(node_one),
+                                                  'n': 'foo_heat',
+                                                  'v': 0.5, 'd': 'float'},
+                                                 {'po': str(node_one),
+                                                  'n': 'foo_rank',
+                                                  'v': 1, 'd': 'integer'},
+                                                 {'po': node_two,
+                                                  'n': 'foo_heat',
+                                                  'v': 0.75, 'd': 'float'},
+                                                 {'po': node_two,
+                                                  'n': 'other',
+                                                  'v': 'x', 'd': 'string'}]},
+                             {'edges': []}]}
+        diffuser = HeatDiffusion()
+        res = diffuser._append_diffusion_result_to_network(net_cx, diff_res,
+                                                           'foo')
+        self.assertEqual([{'po': node_one, 'n': 'foo_heat', 'v': 0.5,
+                           'd': 'double'},
+                          {'po': node_one, 'n': 'foo_rank', 'v': 1,
+                           'd': 'integer'}],
+                         res.get_node_attributes(node_one))
+        self.assertEqual([{'po': node_two, 'n': 'foo_heat', 'v': 0.75,
+                           'd': 'double'}],
+                         res.get_node_attributes(node_two))
+
+    def test_deserialize_response(self):
+        diffuser = HeatDiffusion()
+        with requests_mock.Mocker() as m:
+            m.get('http://foo.com', status_code=200,
+                  text='{"data": [{"x": 1.5}]}')
+            resp = requests.get('http://foo.com')
+            self.assertEqual({'data': [{'x': 1.5}]},
+                             diffuser._deserialize_response(resp))
+            with mock.patch('networkheatdiffusion.base.orjson', None):
+                self.assertEqual({'data': [{'x': 1.5}]},
+                                 diffuser._deserialize_response(resp))
+
+            # NaN is not valid JSON but is accepted by json module
+            m.get('http://foo.com', status_code=200,
+                  text='{"data": [{"x": NaN}]}')
+            resp = requests.get('http://foo.com')
+            res = diffuser._deserialize_response(resp)
+            self.assertTrue(np.isnan(res['data'][0]['x']))
+
+    def test_run_diffusion_via_service(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        node_one = net_cx.create_node('1')
+        node_two = net_cx.create_node('2')
+        net_cx.create_edge(edge_source=node_one, edge_target=node_two)
+        net_cx.add_node_attribute(property_of=node_one,
+                                  name=constants.DEFAULT_INPUT,
+                                  values=1.0, type='double')
+        resp = {'data': [{'nodes': []},
+                         {'nodeAttributes': [{'po': str(node_one),
+                                              'n': constants.DEFAULT_RANK,
+                                              'v': 0, 'd': 'integer'},
+                                             {'po': str(node_one),
+                                              'n': constants.DEFAULT_HEAT,
+                                              'v': 0.9, 'd': 'float'},
+                                             {'po': str(node_two),
+                                              'n': 'foo',
+                                              'v': 'x', 'd': 'string'}]}]}
+        diffuser = HeatDiffusion(service_endpoint='http://foo.com/diffuse')
+        with requests_mock.Mocker() as m:
+            m.post('http://foo.com/diffuse', status_code=200, json=resp)
+            with mock.patch.object(diffuser._session, 'post',
+                                   wraps=diffuser._session.post) as mock_post:
+                res_cx = diffuser.run_diffusion(net_cx, time_param=0.5,
+                                                via_service=True)
+                self.assertEqual(1, mock_post.call_count)
+            self.assertEqual('application/json',
+                             m.last_request.headers['Content-Type'])
+            self.assertEqual({'time': ['0.5']}, m.last_request.qs)
+            sent = m.last_request.json()
+        for aspect in sent:
+            if 'nodeAttributes' in aspect:
+                self.assertEqual('1.0', aspect['nodeAttributes'][0]['v'])
+
+        self.assertEqual({'po': node_one, 'n': constants.DEFAULT_RANK,
+                          'v': 0, 'd': 'integer'},
+                         res_cx.get_node_attribute(node_one,
+                                                   constants.DEFAULT_RANK))
+        self.assertEqual({'po': node_one, 'n': constants.DEFAULT_HEAT,
+                          'v': 0.9, 'd': 'double'},
+                         res_cx.get_node_attribute(node_one,
+                                                   constants.DEFAULT_HEAT))
+        self.assertIsNone(res_cx.get_node_attribute(node_two, 'foo'))
+
+    def test_run_diffusion_via_service_error(self):
+        net_cx = ndex2.nice_cx_network.NiceCXNetwork()
+        net_cx.create_node('1')
+        diffuser = HeatDiffusion(service_endpoint='http://foo.com/diffuse')
+        with requests_mock.Mocker() as m:
+            m.post('http://foo.com/diffuse', status_code=500, text='error')
+            try:
+                diffuser.run_diffusion(net_cx, via_service=True)
+                self.fail('Expected HeatDiffusionError')
+            except HeatDiffusionError as he:
+                self.assertEqual('Received error code: 500 : (error) from '
+                                 'call to diffusion service: '
+                                 'http://foo.com/diffuse', str(he))
+
     def test_build_post_url(self):
         diffuser = HeatDiffusion()
         # try with no arguments
@@ -11,6 +11,7 @@ Tests for `networkheatdiffusion` module.
 import os
 import sys
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import ndex2
 
 
@@ -46,28 +47,34 @@ class TestIntegrationHeatDiffusion(unittest.TestCase):
         :rtype: dict
         """
         node_dict = dict()
-        for node_id, node_obj in net_cx.get_nodes():
-            n_attr = net_cx.get_node_attribute(node_id, 'diffusion_output_rank')
-            if n_attr is None:
+        for node_id, n_attributes in net_cx.nodeAttributes.items():
+            attr_values = dict()
+            for n_attr in n_attributes:
+                attr_values.setdefault(n_attr['n'], n_attr['v'])
+            if 'diffusion_output_rank' not in attr_values:
                 continue
-            rank = n_attr['v']
-            n_attr = net_cx.get_node_attribute(node_id, 'diffusion_output_heat')
-            self.assertIsNotNone(n_attr)
-            node_dict[node_obj['n']] = (rank, n_attr['v'])
+            self.assertIn('diffusion_output_heat', attr_values)
+            node_dict[net_cx.get_node(node_id)['n']] =\
+                (attr_values['diffusion_output_rank'],
+                 attr_values['diffusion_output_heat'])
         return node_dict
 
     def test_diffusion_local_and_remote(self):
         net_cx = ndex2.create_nice_cx_from_file(TestIntegrationHeatDiffusion.TEST_NETWORK)
         diffuser = HeatDiffusion()
         diffuser.add_seed_nodes_by_node_name(net_cx, seed_nodes=['E', 'M'])
-        local_diffuse_cx = diffuser.run_diffusion(net_cx)
-
-        local_node_dict = self.get_dict_of_node_name_to_diffusion_rank(local_diffuse_cx)
 
         r2_cx = ndex2.create_nice_cx_from_file(TestIntegrationHeatDiffusion.TEST_NETWORK)
         diffuser.add_seed_nodes_by_node_name(r2_cx, seed_nodes=['E', 'M'])
-        remote_diffuse_cx = diffuser.run_diffusion(r2_cx, via_service=True)
 
+        # local diffusion runs while waiting on the remote service
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(diffuser.run_diffusion, net_cx),
+                       executor.submit(diffuser.run_diffusion, r2_cx,
+                                       via_service=True)]
+            local_diffuse_cx, remote_diffuse_cx = [f.result() for f in futures]
+
+        local_node_dict = self.get_dict_of_node_name_to_diffusion_rank(local_diffuse_cx)
         remote_node_dict = self.get_dict_of_node_name_to_diffusion_rank(remote_diffuse_cx)
 
         # Couple issues found